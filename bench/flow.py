@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+'''Measure the size of flow graphs and the speed of traversing them.
+
+Generates a synthetic function with a long if/elif chain inside nested
+loops (see ``synth.py``), so that its CFG has thousands of blocks, and
+prints the memory used by the graph itself (the blocks, their per-block
+data and the edges, but not the steps in the blocks) after the blocks phase
+and after the liveness pass, along with the time taken to order the blocks,
+to run a dataflow analysis over them and to run the liveness pass.'''
+
+from __future__ import print_function
+import array, copy, optparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synth
+from runac import blocks, dataflow, liveness, parser, util
+
+CONTAINERS = dict, list, tuple, set, frozenset, array.array
+
+def size(obj, seen):
+	'''Returns the memory used by `obj`, counting blocks, flow graphs and
+	the containers they refer to, but not the steps in the blocks'''
+	
+	if id(obj) in seen or (isinstance(obj, int) and -5 <= obj <= 256):
+		return 0
+	
+	seen.add(id(obj))
+	res = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		for k, v in util.items(obj):
+			res += size(k, seen) + size(v, seen)
+	elif isinstance(obj, CONTAINERS) and not isinstance(obj, array.array):
+		for e in obj:
+			res += size(e, seen)
+	elif isinstance(obj, blocks.Block):
+		res += size(getattr(obj, '__dict__', {}), seen)
+		for k, v in util.items(util.attribs(obj)):
+			if k == 'steps':
+				res += sys.getsizeof(v)
+			elif isinstance(v, CONTAINERS + (int,)):
+				res += size(v, seen)
+	elif isinstance(obj, blocks.FlowGraph) or hasattr(obj, 'blocks'):
+		res += size(getattr(obj, '__dict__', {}), seen)
+		for k, v in util.items(util.attribs(obj)):
+			res += size(v, seen)
+	elif hasattr(obj, '__slots__'):
+		for k, v in util.items(util.attribs(obj)):
+			res += size(v, seen)
+	
+	return res
+
+def best(fun, *args):
+	'''Returns the fastest of five runs of `fun`, in seconds'''
+	res = None
+	for i in range(5):
+		start = time.time()
+		fun(*args)
+		took = time.time() - start
+		res = took if res is None else min(res, took)
+	return res
+
+def analyze(code):
+	'''Run the liveness pass on a copy of `code`'''
+	liveness.analyze(copy.deepcopy(code))
+
+def main():
+
+	cli = optparse.OptionParser(usage='%prog [options]')
+	cli.add_option('--depth', type='int', default=2000,
+	               help='length of the if/elif chain (default: 2000)')
+	cli.add_option('--loops', type='int', default=2,
+	               help='nesting depth of while loops (default: 2)')
+	opts, args = cli.parse_args()
+	
+	knobs = dict(synth.DEFAULTS, functions=1, depth=opts.depth)
+	knobs.update(loops=opts.loops, classes=0, traits=0, generators=0)
+	fd, fn = tempfile.mkstemp(suffix='.rns')
+	with os.fdopen(fd, 'w') as f:
+		f.write(synth.generate(**knobs))
+	
+	parser.build()
+	try:
+		mod = blocks.Module(parser.parse('Runa', fn))
+	finally:
+		os.unlink(fn)
+	
+	code = [fun for (name, fun) in mod.code if name == 'f0'][0]
+	flow, count = code.flow, len(code.flow.blocks)
+	print('%i blocks' % count)
+	mem = size(flow, set())
+	print('graph:    %10i bytes %8.1f bytes/block' % (mem, mem / float(count)))
+	
+	print('order:    %10.2f ms' % (best(dataflow.order, flow) * 1000))
+	gen = {i: 1 << (i % 64) for i in flow.blocks}
+	solve = lambda: dataflow.solve('bench', flow, gen, {})
+	print('solve:    %10.2f ms' % (best(solve) * 1000))
+	took = best(analyze, code) - best(copy.deepcopy, code)
+	print('liveness: %10.2f ms' % (took * 1000))
+	
+	liveness.analyze(code)
+	mem = size(flow, set())
+	print('analyzed: %10i bytes %8.1f bytes/block' % (mem, mem / float(count)))
+
+if __name__ == '__main__':
+	main()
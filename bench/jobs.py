@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+'''Measure the speedup from running the passes in parallel.
+
+Generates a synthetic program (see ``synth.py``) and generates LLVM IR for
+it with different numbers of worker processes (see ``runac.JOBS``), with
+the function cache disabled, printing the fastest time for each. The IR
+must be the same as for the serial run; this is checked as well.'''
+
+from __future__ import print_function
+import multiprocessing, optparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runac, synth
+from runac import cache
+
+def best(fn, jobs, repeat):
+	'''Returns the fastest of `repeat` runs with `jobs` workers, in
+	seconds, and the IR generated'''
+	runac.JOBS, res = jobs, None
+	for i in range(repeat):
+		start = time.time()
+		ir = runac.ir(fn)
+		took = time.time() - start
+		res = took if res is None else min(res, took)
+	return res, ir
+
+def main():
+
+	parser = optparse.OptionParser(usage='%prog [options]')
+	synth.options(parser)
+	parser.add_option('--jobs', default='1,2,4',
+	                  help='comma-separated numbers of workers')
+	parser.add_option('--repeat', type='int', default=3,
+	                  help='number of runs (default: 3)')
+	parser.set_defaults(functions=800)
+	opts, args = parser.parse_args()
+	
+	runac.core() # warm the core library cache
+	cache.ENABLED = False
+	knobs = {k: getattr(opts, k) for k in synth.DEFAULTS}
+	fd, fn = tempfile.mkstemp(suffix='.rns')
+	with os.fdopen(fd, 'w') as f:
+		f.write(synth.generate(**knobs))
+	
+	try:
+		base, cpus = None, multiprocessing.cpu_count()
+		print('%i functions, %i CPUs' % (opts.functions, cpus))
+		for jobs in [int(n) for n in opts.jobs.split(',')]:
+			took, ir = best(fn, jobs, opts.repeat)
+			base = base or (took, ir)
+			assert ir == base[1], 'IR differs from the serial run'
+			bits = jobs, took * 1000, base[0] / took
+			print('%3i jobs %10.2fms %8.2fx' % bits)
+	finally:
+		os.unlink(fn)
+
+if __name__ == '__main__':
+	main()
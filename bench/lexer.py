@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+'''Measure lexer throughput.
+
+Lexes a large source file (by default, a synthetic program from ``synth.py``
+with the given number of functions) with both the rply-based reference lexer
+and the hand-written scanner, and prints the number of tokens per second for
+each. Also checks that both return the same tokens.'''
+
+from __future__ import print_function
+import optparse, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synth
+from runac import parser
+
+LEXERS = ('rply', parser.reference), ('scanner', parser.lex)
+
+def tokens(fun, src):
+	'''Returns a list of token tuples, including positions'''
+	res = []
+	for t in fun(src):
+		pos = t.source_pos
+		res.append((t.name, t.value, pos.idx, pos.lineno, pos.colno))
+	return res
+
+def measure(fun, src, repeat):
+	'''Returns the number of tokens and the fastest time to lex `src`'''
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		count = sum(1 for t in fun(src))
+		took = time.time() - start
+		best = took if best is None else min(best, took)
+	return count, best
+
+def main():
+
+	parser = optparse.OptionParser(usage='%prog [options] [file]')
+	parser.add_option('--functions', type='int', default=500,
+	                  help='size of the synthetic program (default: 500)')
+	parser.add_option('--repeat', type='int', default=3,
+	                  help='number of runs (default: 3)')
+	opts, args = parser.parse_args()
+	
+	if args:
+		with open(args[0]) as f:
+			src = f.read()
+	else:
+		knobs = dict(synth.DEFAULTS, functions=opts.functions)
+		knobs['classes'] = knobs['traits'] = opts.functions // 10
+		src = synth.generate(**knobs)
+	
+	ref, new = [tokens(fun, src) for name, fun in LEXERS]
+	if ref != new:
+		print('error: lexers disagree')
+		return 1
+	
+	print('%i bytes, %i lines' % (len(src), src.count('\n')))
+	print('%-10s %10s %10s %14s' % ('lexer', 'tokens', 'time (ms)', 'tokens/s'))
+	res = {}
+	for name, fun in LEXERS:
+		count, took = res[name] = measure(fun, src, opts.repeat)
+		bits = name, count, took * 1000, count / took
+		print('%-10s %10i %10.1f %14.0f' % bits)
+	
+	print('speedup: %.1fx' % (res['rply'][1] / res['scanner'][1]))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+'''Measure how the liveness pass scales with the shape of the CFG.
+
+Generates synthetic programs (see ``synth.py``) with increasingly long
+if/elif chains inside nested while loops, lowers them to CFGs and times
+the liveness pass, which computes reaching definitions with an iterative
+bitset solver, against the recursive search over predecessor paths it
+replaced (kept here as ``recursive()``). Also checks that both find the
+same definitions for every use.'''
+
+from __future__ import print_function
+import copy, optparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synth
+from runac import blocks, liveness, parser, util
+
+def defined(name, bl, seen):
+	'''The original search for the blocks assigning to `name` that reach
+	block `bl`, copying the set of blocks seen on the path at every step'''
+	
+	if name in bl.assigns:
+		return {bl.id}
+	elif not bl.preds:
+		return {None}
+	
+	all = set()
+	for p in bl.preds:
+		if p.id not in seen:
+			all.update(defined(name, p, seen | {bl.id}))
+	
+	return all
+
+def recursive(mod):
+	'''Fill in the ``uses``, ``assigns`` and ``origin`` maps of the module's
+	blocks the way the liveness pass did before'''
+	analyzer = liveness.Analyzer()
+	for fname, code in mod.code:
+		
+		refs, flow = {}, sorted(util.items(code.flow.blocks))
+		for id, bl in flow:
+			bl.uses, bl.assigns = {}, {}
+			for i, step in enumerate(bl.steps):
+				analyzer.vars = set(), set()
+				analyzer.visit(step)
+				for name in analyzer.vars[0]:
+					bl.uses.setdefault(name, set()).add(i)
+					refs.setdefault(id, []).append((i, name))
+				for name in analyzer.vars[1]:
+					bl.assigns.setdefault(name, set()).add(i)
+					refs.setdefault(id, []).append((i, name))
+		
+		for id, bl in flow:
+			bl.origin = {}
+			for sid, name in refs.get(id, []):
+				
+				origin = bl.origin[name, sid] = set()
+				assigned = bl.assigns.get(name, set())
+				if assigned and min(assigned) < sid:
+					origin.add(id)
+				elif not bl.preds:
+					origin.add(None)
+				else:
+					for p in bl.preds:
+						origin.update(defined(name, p, set()))
+
+def origins(mod):
+	'''Returns the ``origin`` maps of all blocks in the module'''
+	res = {}
+	for fname, code in mod.code:
+		for id, bl in util.items(code.flow.blocks):
+			res[repr(fname), id] = bl.origin
+	return res
+
+def measure(fun, mod, repeat):
+	'''Returns a copy of `mod` processed by `fun` and the fastest time'''
+	best = None
+	for i in range(repeat):
+		cur = copy.deepcopy(mod)
+		start = time.time()
+		fun(cur)
+		took = time.time() - start
+		best = took if best is None else min(best, took)
+	return cur, best
+
+def lower(src):
+	'''Parse and lower the source code in `src` to a Module'''
+	fd, fn = tempfile.mkstemp(suffix='.rns')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			f.write(src)
+		return blocks.Module(parser.parse('Runa', fn))
+	finally:
+		os.unlink(fn)
+
+def main():
+
+	cli = optparse.OptionParser(usage='%prog [options]')
+	cli.add_option('--functions', type='int', default=5,
+	               help='functions per program (default: 5)')
+	cli.add_option('--depth', type='int', default=32,
+	               help='longest if/elif chain (default: 32)')
+	cli.add_option('--loops', type='int', default=3,
+	               help='nesting depth of while loops (default: 3)')
+	cli.add_option('--repeat', type='int', default=3,
+	               help='number of runs (default: 3)')
+	opts, args = cli.parse_args()
+	
+	parser.build()
+	print('%-6s %8s %14s %14s %8s' % (
+		'depth', 'blocks', 'recursive (ms)', 'bitsets (ms)', 'speedup'
+	))
+	
+	depth = 2
+	while depth <= opts.depth:
+		
+		knobs = dict(synth.DEFAULTS, functions=opts.functions, depth=depth)
+		knobs.update(loops=opts.loops, classes=0, traits=0, generators=0)
+		mod = lower(synth.generate(**knobs))
+		size = sum(len(code.flow.blocks) for fname, code in mod.code)
+		
+		ref, old = measure(recursive, mod, opts.repeat)
+		res, new = measure(liveness.liveness, mod, opts.repeat)
+		if origins(ref) != origins(res):
+			print('error: reaching definitions differ at depth %i' % depth)
+			return 1
+		
+		bits = depth, size, old * 1000, new * 1000, old / new
+		print('%-6i %8i %14.1f %14.1f %7.1fx' % bits)
+		depth *= 2
+	
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+'''Measure the memory used by syntax tree and CFG nodes.
+
+Parses a large synthetic program (see ``synth.py``) and lowers it to CFGs,
+tracing the memory allocated for each of these steps with ``tracemalloc``,
+and prints the number of nodes, the memory per node (including everything
+a node refers to, like its source position), the size of the node objects
+themselves (including their ``__dict__``, if any) and the time taken to walk
+and to hash all of the nodes in the module.'''
+
+from __future__ import print_function
+import gc, optparse, os, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synth
+from runac import blocks, parser
+
+def walk(obj):
+	'''Returns a list of the nodes in a syntax tree or list of them'''
+	stack, res = [obj], []
+	while stack:
+		node = stack.pop()
+		if isinstance(node, list):
+			stack += node
+		elif hasattr(node, 'fields'):
+			res.append(node)
+			stack += [getattr(node, k, None) for k in node.fields]
+		elif hasattr(node, 'suite'):
+			stack += node.suite
+	return res
+
+def footprint(nodes):
+	'''Returns the average size of the node objects, not counting the
+	objects they refer to'''
+	total = 0
+	for node in nodes:
+		total += sys.getsizeof(node)
+		if hasattr(node, '__dict__'):
+			total += sys.getsizeof(node.__dict__)
+	return total / float(len(nodes))
+
+def best(fun, *args):
+	'''Returns the fastest of five runs of `fun`, in seconds'''
+	res = None
+	for i in range(5):
+		start = time.time()
+		fun(*args)
+		took = time.time() - start
+		res = took if res is None else min(res, took)
+	return res
+
+def cfgs(mod):
+	'''Returns a list of the steps in all blocks of the module'''
+	return [bl.steps for name, fun in mod.code for bl in fun.flow.blocks.values()]
+
+def measure(fun, *args):
+	'''Returns the result of calling `fun`, the memory it allocated and
+	still holds on to, and the time taken'''
+	gc.collect()
+	tracemalloc.start()
+	start = time.time()
+	res = fun(*args)
+	took = time.time() - start
+	mem = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return res, mem, took
+
+def main():
+
+	cli = optparse.OptionParser(usage='%prog [options]')
+	cli.add_option('--functions', type='int', default=500,
+	               help='size of the synthetic program (default: 500)')
+	opts, args = cli.parse_args()
+	
+	knobs = dict(synth.DEFAULTS, functions=opts.functions)
+	fd, fn = tempfile.mkstemp(suffix='.rns')
+	with os.fdopen(fd, 'w') as f:
+		f.write(synth.generate(**knobs))
+	
+	parser.build()
+	try:
+		node, mem, took = measure(parser.parse, 'Runa', fn)
+		nodes = walk(node.suite)
+		print('%-8s %8i nodes %10.1f bytes/node %6.1f bytes/object %8.1f ms parse' % (
+			'ast', len(nodes), mem / float(len(nodes)), footprint(nodes), took * 1000,
+		))
+		mod, mem, took = measure(blocks.Module, node)
+		nodes = walk(cfgs(mod))
+		print('%-8s %8i nodes %10.1f bytes/node %6.1f bytes/object %8.1f ms blocks' % (
+			'cfg', len(nodes), mem / float(len(nodes)), footprint(nodes), took * 1000,
+		))
+	finally:
+		os.unlink(fn)
+	
+	steps = cfgs(mod)
+	print('walking %i nodes: %.1f ms' % (len(nodes), best(walk, steps) * 1000))
+	print('hashing %i nodes: %.1f ms' % (len(nodes), best(set, nodes) * 1000))
+
+if __name__ == '__main__':
+	main()
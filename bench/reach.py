@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+'''Measure the effect of leaving out unreachable core library code.
+
+Compiles the test programs (or the files named on the command line) to
+LLVM IR with and without the reach pass (see ``runac.reach``), with the
+function cache disabled, and prints the number of functions defined, the
+size of the generated IR and the time taken to generate it for both. With
+``--clang``, the time taken by clang to compile the IR to an object file
+is measured as well.'''
+
+from __future__ import print_function
+import optparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runac
+from runac import cache, reach
+from simplify import programs
+
+def best(fun, repeat):
+	'''Returns the fastest of `repeat` runs of `fun`, in seconds, and the
+	result of the last one'''
+	res = None
+	for i in range(repeat):
+		start = time.time()
+		out = fun()
+		took = time.time() - start
+		res = took if res is None else min(res, took)
+	return res, out
+
+def measure(fn, prune, repeat, clang):
+	'''Returns a dict with the number of functions, IR lines and bytes for
+	`fn`, the time taken to generate the IR and to compile it'''
+	
+	reach.ENABLED = prune
+	took, ir = best(lambda: runac.ir(fn), repeat)
+	lines = ir.splitlines()
+	res = {'ir': took, 'clang': 0.0, 'bytes': len(ir), 'lines': len(lines)}
+	res['functions'] = sum(1 for ln in lines if ln.startswith('define '))
+	if not clang:
+		return res
+	
+	fd, obj = tempfile.mkstemp(suffix='.o')
+	os.close(fd)
+	try:
+		res['clang'] = best(lambda: runac.compile(ir, obj, link=False), repeat)[0]
+	finally:
+		os.unlink(obj)
+	return res
+
+def main():
+
+	cli = optparse.OptionParser(usage='%prog [options] [file ...]')
+	cli.add_option('--repeat', type='int', default=3,
+	               help='number of runs (default: 3)')
+	cli.add_option('--clang', action='store_true',
+	               help='also measure the time taken by clang')
+	opts, args = cli.parse_args()
+	
+	runac.core() # warm the core library cache
+	cache.ENABLED = False
+	keys = 'functions', 'lines', 'bytes', 'ir', 'clang'
+	totals = {False: dict.fromkeys(keys, 0), True: dict.fromkeys(keys, 0)}
+	fns = programs(args)
+	for fn in fns:
+		for flag in (False, True):
+			res = measure(fn, flag, opts.repeat, opts.clang)
+			for k in keys:
+				totals[flag][k] += res[k]
+	
+	print('%i programs, including the core library' % len(fns))
+	print('%-10s %10s %10s %10s' % ('', 'without', 'with', 'change'))
+	for k in ('functions', 'lines', 'bytes'):
+		old, new = totals[False][k], totals[True][k]
+		change = (new / float(old) - 1) * 100 if old else 0
+		print('%-10s %10i %10i %+9.1f%%' % (k, old, new, change))
+	
+	for k in ('ir', 'clang') if opts.clang else ('ir',):
+		old, new = totals[False][k] * 1000, totals[True][k] * 1000
+		bits = k, old, new, (new / old - 1) * 100
+		print('%-10s %8.1fms %8.1fms %+9.1f%%' % bits)
+
+if __name__ == '__main__':
+	main()
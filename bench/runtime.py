@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+'''Measure the speed of the code generated by the compiler.
+
+Compiles each of the programs in ``bench/programs`` (or the ones named on
+the command line), runs the resulting binaries a number of times and prints
+the fastest and median wall time for each. The fastest time is compared to
+the one stored in a baseline file (``bench/baseline.json`` by default), and
+programs that got slower by more than the threshold are flagged, in which
+case the exit status is 1; so it is if a program fails to run, which is
+reported before moving on to the next one. Use ``--save`` to write the
+current timings to the baseline file.
+
+The generated code allocates stack space for temporaries each time around
+a loop, so the loop counts in the programs are kept low enough for them to
+run with the default stack size (8 MB on Linux).
+
+The optimization options (``-O``, ``--march``, ``--mcpu`` and ``--passes``)
+are passed on to the compiler and stored in the baseline along with the
+timings; a warning is printed when comparing against a baseline that was
+recorded with other options.'''
+
+from __future__ import print_function
+import json, optparse, os, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runac
+
+DIR = os.path.join(ROOT, 'bench', 'programs')
+BASELINE = os.path.join(ROOT, 'bench', 'baseline.json')
+
+def programs(names):
+	'''Returns a sorted list of (name, file name) tuples'''
+	if not names:
+		names = [fn[:-4] for fn in os.listdir(DIR) if fn.endswith('.rns')]
+	return sorted((n, os.path.join(DIR, n + '.rns')) for n in names)
+
+def flags(opts):
+	'''Returns a dict of the optimization options in `opts`'''
+	return {k: getattr(opts, k) for k in ('level', 'march', 'mcpu', 'passes')}
+
+def build(fn, dir, opts):
+	'''Compile `fn` to a binary in `dir`, returning the binary's name or
+	None if it could not be compiled'''
+	out = os.path.join(dir, os.path.basename(fn)[:-4])
+	passes = opts.passes.split(',') if opts.passes else None
+	runac.build(fn, out, opts.level, opts.march, opts.mcpu, passes)
+	return out if os.path.exists(out) else None
+
+def timed(bin, n):
+	'''Returns a sorted list of the wall times for `n` runs of `bin` and
+	None, or None and the exit status of the first run that failed'''
+	res = []
+	with open(os.devnull, 'w') as null:
+		for i in range(n):
+			start = time.time()
+			status = subprocess.call([bin], stdout=null)
+			if status:
+				return None, status
+			res.append(time.time() - start)
+	return sorted(res), None
+
+def main():
+
+	parser = optparse.OptionParser(usage='%prog [options] [program ...]')
+	parser.add_option('-n', type='int', default=5, help='runs per program')
+	parser.add_option('--baseline', default=BASELINE,
+	                  help='baseline file (default: bench/baseline.json)')
+	parser.add_option('--threshold', type='float', default=0.1,
+	                  help='allowed slowdown (default: 0.1, for 10%)')
+	parser.add_option('--save', action='store_true',
+	                  help='write the timings to the baseline file')
+	parser.add_option('-O', dest='level', choices=sorted(runac.LEVELS),
+	                  help='optimization level (0-3 or s)')
+	parser.add_option('--march', help='target architecture for clang')
+	parser.add_option('--mcpu', help='target CPU for clang')
+	parser.add_option('--passes', help='comma-separated LLVM passes for opt')
+	opts, args = parser.parse_args()
+	
+	base = {'options': flags(opts), 'times': {}}
+	if os.path.exists(opts.baseline):
+		with open(opts.baseline) as f:
+			base = json.load(f)
+	
+	if base['options'] != flags(opts) and not opts.save:
+		print('warning: baseline was recorded with %s' % base['options'])
+	
+	head = '%-14s %10s %10s %10s %8s' % (
+		'program', 'min (ms)', 'med (ms)', 'base (ms)', 'change'
+	)
+	print(head)
+	print('-' * len(head))
+	
+	dir, res, slower, failed = tempfile.mkdtemp(), {}, [], []
+	try:
+		for name, fn in programs(args):
+			
+			bin = build(fn, dir, opts)
+			if bin is None:
+				print('%-14s %10s' % (name, 'not built'))
+				continue
+			
+			times, status = timed(bin, opts.n)
+			if times is None:
+				how = 'signal %i' % -status if status < 0 else 'status %i' % status
+				print('%-14s %10s  (%s)' % (name, 'failed', how))
+				failed.append(name)
+				continue
+			
+			res[name] = times[0]
+			bits = name, times[0] * 1000, times[len(times) // 2] * 1000
+			line = '%-14s %10.1f %10.1f' % bits
+			if name in base['times']:
+				prev = base['times'][name]
+				change = times[0] / prev - 1
+				line += ' %10.1f %+7.1f%%' % (prev * 1000, change * 100)
+				if change > opts.threshold:
+					slower.append(name)
+					line += '  slower'
+			print(line)
+	
+	finally:
+		shutil.rmtree(dir)
+	
+	if opts.save and res:
+		if base['options'] != flags(opts):
+			base['times'] = {}
+		base['options'] = flags(opts)
+		base['times'].update(res)
+		with open(opts.baseline, 'w') as f:
+			json.dump(base, f, indent=1, sort_keys=True)
+			f.write('\n')
+	
+	return 1 if failed or (slower and not opts.save) else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''Measure the effect of the simplify pass.
+
+Compiles the test programs (or the files named on the command line) to
+LLVM IR with and without the simplify pass, including the core library
+functions merged into each program, and prints the number of blocks, the
+size of the generated IR (labels and lines) and the time spent in the
+other passes for both, along with the time taken by simplify itself.'''
+
+from __future__ import print_function
+import optparse, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runac
+from runac import codegen, util
+
+def measure(fn, simplify, repeat):
+	'''Returns a dict with the number of blocks, IR labels and IR lines for
+	`fn`, the time taken by the other passes and by simplify'''
+	res = None
+	for i in range(repeat):
+		
+		mod = runac.prepare(fn)
+		runac.merge(mod)
+		cur = {'passes': 0.0, 'simplify': 0.0}
+		for name, fun in runac.passes():
+			if name == 'simplify' and not simplify:
+				continue
+			start = time.time()
+			fun(mod)
+			took = time.time() - start
+			cur['simplify' if name == 'simplify' else 'passes'] += took
+		
+		lines = codegen.generate(mod).splitlines()
+		cur['blocks'] = sum(len(code.flow.blocks) for (k, code) in mod.code)
+		cur['labels'] = sum(1 for ln in lines if ln.startswith('L'))
+		cur['lines'] = len(lines)
+		if res is None:
+			res = cur
+		else:
+			res['passes'] = min(res['passes'], cur['passes'])
+			res['simplify'] = min(res['simplify'], cur['simplify'])
+	
+	return res
+
+def programs(args):
+	'''Returns a sorted list of the test programs that compile to IR'''
+	if args:
+		return args
+	dir = os.path.join(ROOT, 'tests')
+	res = []
+	for fn in sorted(os.listdir(dir)):
+		if not fn.endswith('.rns'):
+			continue
+		fn = os.path.join(dir, fn)
+		with open(fn) as f:
+			if '"show"' in f.readline():
+				continue
+		try:
+			runac.ir(fn)
+		except (util.Error, util.ParseError):
+			continue
+		res.append(fn)
+	return res
+
+def main():
+
+	cli = optparse.OptionParser(usage='%prog [options] [file ...]')
+	cli.add_option('--repeat', type='int', default=3,
+	               help='number of runs (default: 3)')
+	opts, args = cli.parse_args()
+	
+	runac.core() # warm the core library cache
+	keys = 'blocks', 'labels', 'lines', 'passes', 'simplify'
+	totals = {False: dict.fromkeys(keys, 0), True: dict.fromkeys(keys, 0)}
+	fns = programs(args)
+	for fn in fns:
+		for flag in (False, True):
+			res = measure(fn, flag, opts.repeat)
+			for k in keys:
+				totals[flag][k] += res[k]
+	
+	print('%i programs, including the core library' % len(fns))
+	print('%-10s %10s %10s %10s' % ('', 'without', 'with', 'change'))
+	for k in ('blocks', 'labels', 'lines'):
+		old, new = totals[False][k], totals[True][k]
+		change = (new / float(old) - 1) * 100 if old else 0
+		print('%-10s %10i %10i %+9.1f%%' % (k, old, new, change))
+	
+	old, new = totals[False]['passes'] * 1000, totals[True]['passes'] * 1000
+	print('%-10s %8.1fms %8.1fms %+9.1f%%' % ('passes', old, new, (new / old - 1) * 100))
+	print('%-10s %10s %8.1fms' % ('simplify', '-', totals[True]['simplify'] * 1000))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''Measure how the stages of the compiler scale with program size.
+
+Generates synthetic programs (see ``synth.py``) for a range of values of one
+of the knobs, keeping the others fixed, and times each stage of the compiler
+on them: lexing, parsing, CFG construction, merging of the core library,
+each of the passes and code generation. For each step up in size, the
+growth exponent is printed as well (1.0 is linear, 2.0 is quadratic), which
+makes super-linear behaviour stand out.'''
+
+from __future__ import print_function
+import gc, math, optparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runac, synth
+from runac import blocks, codegen, parser
+
+def once(fn, src):
+	'''Compile `fn` once, returning a list of (stage, seconds) tuples'''
+	
+	res, last = [], [time.time()]
+	def lap(name):
+		now = time.time()
+		res.append((name, now - last[0]))
+		last[0] = now
+	
+	list(parser.lex(src))
+	lap('lex')
+	node = parser.parse('Runa', fn)
+	lap('parse')
+	mod = blocks.Module(node)
+	lap('blocks')
+	runac.merge(mod)
+	lap('merge')
+	for name, fun in runac.passes():
+		fun(mod)
+		lap(name)
+	codegen.generate(mod)
+	lap('codegen')
+	return res
+
+def stages(fn, repeat):
+	'''Returns a list of (stage, seconds) tuples for compiling `fn`,
+	using the fastest of `repeat` runs for each stage'''
+	
+	with open(fn) as f:
+		src = f.read()
+	
+	runs = []
+	gc.disable()
+	try:
+		for i in range(repeat):
+			runs.append(once(fn, src))
+	finally:
+		gc.enable()
+	
+	names = [name for (name, t) in runs[0]]
+	return [(n, min(r[i][1] for r in runs)) for (i, n) in enumerate(names)]
+
+def main():
+
+	parser = optparse.OptionParser(usage='%prog [options]')
+	synth.options(parser)
+	parser.add_option('--scale', default='functions',
+	                  help='knob to vary (default: functions)')
+	parser.add_option('--sizes', default='25,50,100,200',
+	                  help='comma-separated values for the knob')
+	parser.add_option('--repeat', type='int', default=3,
+	                  help='number of runs per size (default: 3)')
+	opts, args = parser.parse_args()
+	if opts.scale not in synth.DEFAULTS:
+		parser.error('unknown knob %r' % opts.scale)
+	
+	runac.core() # warm the core library cache
+	sizes = [int(n) for n in opts.sizes.split(',')]
+	results = []
+	for n in sizes:
+		
+		knobs = {k: getattr(opts, k) for k in synth.DEFAULTS}
+		knobs[opts.scale] = n
+		fd, fn = tempfile.mkstemp(suffix='.rns')
+		with os.fdopen(fd, 'w') as f:
+			f.write(synth.generate(**knobs))
+		
+		try:
+			results.append(stages(fn, opts.repeat))
+		finally:
+			os.unlink(fn)
+	
+	names = [name for name, t in results[0]]
+	head = '%-12s' % opts.scale + ''.join('%12i' % n for n in sizes)
+	print(head + '    growth')
+	print('-' * (len(head) + 10))
+	for i, name in enumerate(names):
+		
+		times = [r[i][1] for r in results]
+		row = '%-12s' % name + ''.join('%10.2fms' % (t * 1000) for t in times)
+		
+		growth = []
+		for j in range(1, len(sizes)):
+			if times[j - 1] > 0 and times[j] > 0:
+				num = math.log(times[j] / times[j - 1])
+				den = math.log(sizes[j] / float(sizes[j - 1]))
+				growth.append('%.1f' % (num / den))
+			else:
+				growth.append('-')
+		print(row + '    ' + ' '.join(growth))
+
+if __name__ == '__main__':
+	main()
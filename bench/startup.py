@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+'''Measure start-up latency of the compiler driver.
+
+Runs ``python -m runac <command> <file>`` a number of times for each of the
+driver commands, once with all caches disabled (``--no-cache``, which makes
+the driver rebuild the parser tables and lower the core library) and once
+with warm caches. Prints the median wall time for each and the speed-up.'''
+
+from __future__ import print_function
+import optparse, os, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = [
+	('tokens', []),
+	('parse', []),
+	('show', []),
+	('generate', ['--test']),
+]
+
+def run(cmd, fn, args):
+	call = [sys.executable, '-m', 'runac', cmd, fn] + args
+	start = time.time()
+	subprocess.check_call(call, cwd=ROOT, stdout=open(os.devnull, 'w'))
+	return time.time() - start
+
+def median(xs):
+	xs = sorted(xs)
+	mid = len(xs) // 2
+	return xs[mid] if len(xs) % 2 else (xs[mid - 1] + xs[mid]) / 2.0
+
+def main():
+
+	parser = optparse.OptionParser(usage='%prog [options] [file]')
+	parser.add_option('-n', type='int', default=5, help='runs per command')
+	opts, args = parser.parse_args()
+	fn = os.path.abspath(args[0]) if args else os.path.join(ROOT, 'tests', 'hello.rns')
+	
+	print('%-10s %10s %10s %8s' % ('command', 'cold (ms)', 'warm (ms)', 'speedup'))
+	for cmd, args in COMMANDS:
+		cold = median([run(cmd, fn, args + ['--no-cache']) for i in range(opts.n)])
+		run(cmd, fn, args) # make sure the caches are populated
+		warm = median([run(cmd, fn, args) for i in range(opts.n)])
+		print('%-10s %10.1f %10.1f %7.1fx' % (cmd, cold * 1000, warm * 1000, cold / warm))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''Generate synthetic Runa programs for benchmarking the compiler.
+
+The size and shape of the program is controlled by a few knobs: the number
+of functions, the length of the if/elif chains and the nesting depth of
+while loops in each function, and the number of classes, traits and
+generator functions. The output is deterministic for a given set of knobs.'''
+
+from __future__ import print_function
+import optparse
+
+DEFAULTS = {
+	'functions': 10,
+	'depth': 3,
+	'loops': 1,
+	'classes': 2,
+	'traits': 1,
+	'generators': 1,
+}
+
+def function(i, depth, loops):
+
+	lines = ['def f%i(a: int, b: int) -> int:' % i, '\tx = a + %i' % i]
+	indent = '\t'
+	for j in range(loops):
+		lines.append(indent + 'i%i = b' % j)
+		lines.append(indent + 'while i%i > 0:' % j)
+		indent += '\t'
+		lines.append(indent + 'i%i = i%i - 1' % (j, j))
+	
+	for j in range(depth):
+		kw = 'if' if not j else 'elif'
+		lines.append(indent + '%s x == %i:' % (kw, j))
+		lines.append(indent + '\tx = x + %i' % (j + 1))
+	if depth:
+		lines.append(indent + 'else:')
+		call = 'f%i(x, 1)' % (i - 1) if i else 'x - 1'
+		lines.append(indent + '\tx = %s' % call)
+	
+	lines.append('\treturn x')
+	return lines
+
+def cls(i, traits):
+
+	lines = [
+		'class K%i:' % i,
+		'\t',
+		'\tx: int',
+		'\ty: int',
+		'\t',
+		'\tdef __init__(self, x: int, y: int):',
+		'\t\tself.x = x',
+		'\t\tself.y = y',
+		'\t',
+		'\tdef sum(self) -> int:',
+		'\t\treturn self.x + self.y',
+	]
+	
+	for j in range(traits):
+		lines += [
+			'\t',
+			'\tdef value%i(self) -> int:' % j,
+			'\t\treturn self.x * %i' % (j + 2),
+		]
+	
+	return lines
+
+def trait(i):
+	return [
+		'trait T%i:' % i,
+		'\tdef value%i(self) -> int' % i,
+		'',
+		'def use%i(obj: &T%i) -> int:' % (i, i),
+		'\treturn obj.value%i()' % i,
+	]
+
+def generator(i):
+	return [
+		'def gen%i(n: int) -> iter[int]:' % i,
+		'\ti = n',
+		'\twhile i > 0:',
+		'\t\tyield i + %i' % i,
+		'\t\ti = i - 1',
+	]
+
+def generate(functions=10, depth=3, loops=1, classes=2, traits=1,
+             generators=1):
+	'''Returns the source of a synthetic program as a string'''
+	
+	parts = []
+	for i in range(traits):
+		parts.append(trait(i))
+	for i in range(classes):
+		parts.append(cls(i, traits))
+	for i in range(functions):
+		parts.append(function(i, depth, loops))
+	for i in range(generators):
+		parts.append(generator(i))
+	
+	main = ['def main():']
+	for i in range(functions):
+		main.append('\tprint(f%i(%i, 2))' % (i, i))
+	for i in range(classes):
+		main.append('\tk%i = K%i(%i, 1)' % (i, i, i))
+		main.append('\tprint(k%i.sum())' % i)
+		for j in range(traits):
+			main.append('\tprint(use%i(k%i))' % (j, i))
+	for i in range(generators):
+		main.append('\tfor v in gen%i(3):' % i)
+		main.append('\t\tprint(v)')
+	if len(main) == 1:
+		main.append('\tpass')
+	
+	parts.append(main)
+	return '\n\n'.join('\n'.join(p) for p in parts) + '\n'
+
+def options(parser):
+	'''Add an option for each of the knobs to an OptionParser'''
+	for k, v in sorted(DEFAULTS.items()):
+		parser.add_option('--' + k, type='int', default=v)
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser(usage='%prog [options]')
+	options(parser)
+	opts, args = parser.parse_args()
+	print(generate(**{k: getattr(opts, k) for k in DEFAULTS}), end='')
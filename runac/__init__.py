@@ -1,32 +1,165 @@
 from __future__ import print_function
-from . import (
-	parser, blocks, liveness, typer, specialize,
-	escapes, destructor, codegen, util, pretty
-)
-import os, subprocess, collections, re
+from . import parser, util, cache, stats
+import os, subprocess, collections, re, pickle, importlib, itertools, errno
+import multiprocessing, shutil, tempfile
+
+# Maps pass names to the modules implementing them. Each module has a
+# function with the same name as the pass, which takes a Module.
 
 PASSES = collections.OrderedDict((
-	('liveness', liveness.liveness),
-	('typer', typer.typer),
-	('specialize', specialize.specialize),
-	('escapes', escapes.escapes),
-	('destruct', destructor.destruct),
+	('simplify', 'simplify'),
+	('fold', 'fold'),
+	('liveness', 'liveness'),
+	('typer', 'typer'),
+	('branches', 'fold'),
+	('specialize', 'specialize'),
+	('escapes', 'escapes'),
+	('destruct', 'destructor'),
 ))
 
+def passes(last=None):
+	'''Yields (name, function) tuples for the passes in PASSES, up to and
+	including the pass called `last`. Pass modules are imported on demand,
+	so that the driver only loads the parts of the compiler it needs.'''
+	for name, mod in util.items(PASSES):
+		mod = importlib.import_module('.' + mod, __name__)
+		yield name, getattr(mod, name)
+		if name == last:
+			break
+
 def lex(src):
 	'''Takes a string containing source code, returns list of token tuples'''
 	return parser.lex(src)
 
 def parse(fn):
 	'''Takes a string containing file name, returns an AST Module node'''
-	return parser.parse(fn)
+	return parser.parse('Runa', fn)
+
+# Number of worker processes used to parse and lower independent files
+# (see modules()) and to run the passes over independent functions (see
+# incremental.shard()); None means one for each CPU, 1 disables the pools.
+JOBS = None
+
+def workers(tasks):
+	'''Returns the number of worker processes to use for a number of
+	independent `tasks` (see JOBS); 1 means the work should be done in this
+	process. Daemonic processes (like the workers of another pool) cannot
+	start a pool, so they always do the work themselves.'''
+	if multiprocessing.current_process().daemon:
+		return 1
+	return max(1, min(tasks, JOBS or multiprocessing.cpu_count()))
+
+def lower(job):
+	'''Parse a file and lower it to CFGs. Takes a tuple of a package name
+	and a file name, returns a blocks.Module. This runs in the worker
+	processes of modules(), so both the argument and the result (or the
+	exception raised) are pickled.'''
+	from . import blocks
+	pkg, fn = job
+	with stats.Phase('parse') as phase:
+		node = phase.obj = parser.parse(pkg, fn)
+	with stats.Phase('blocks') as phase:
+		mod = phase.obj = blocks.Module(node)
+	return mod
+
+def modules(jobs):
+	'''Takes a list of (package name, file name) tuples and returns a list
+	of Modules for them (see lower()), in the same order. Files do not depend
+	on each other until they are merged, so they are handled in a pool of
+	worker processes if there is more than one (see workers()).'''
+	
+	count = workers(len(jobs))
+	if count < 2:
+		return [lower(job) for job in jobs]
+	
+	parser.build() # forked workers inherit the tables
+	pool = multiprocessing.Pool(count)
+	try:
+		with stats.Phase('parse'):
+			return pool.map(lower, jobs, 1)
+	finally:
+		pool.terminate()
+		pool.join()
 
-def merge(mod):
-	'''Merge AST Modules for core library files into the given Module'''
-	for fn in os.listdir(util.CORE_DIR):
+CORE = {}
+
+def library():
+	'''Returns the cache key for the core library and a list of jobs (see
+	modules()) for its files, in a fixed order. The key is derived from the
+	contents of the files and the compiler version.'''
+	files, jobs = [], []
+	for fn in sorted(os.listdir(util.CORE_DIR)):
 		if not fn.endswith('.rns'): continue
 		fn = os.path.join(util.CORE_DIR, fn)
-		mod.merge(parser.parse('Runa.core', fn))
+		with open(fn, 'rb') as f:
+			files += [fn, f.read()]
+		jobs.append(('Runa.core', fn))
+	return cache.digest(cache.version(), *files), jobs
+
+def cached(key):
+	'''Returns the pickled core library for `key` (see library()) from
+	memory or from the disk cache, or None if it has to be built'''
+	data = CORE.get(key)
+	if data is None:
+		data = cache.read('core', key)
+		if data is not None:
+			util.note('core library: cache hit (%s)' % key[:12])
+			CORE[key] = data
+	return data
+
+def combine(key, mods):
+	'''Combine the Modules for the core library files into one and store
+	it under `key`. Returns the pickled form.'''
+	from . import blocks
+	lib = blocks.Module()
+	for mod in mods:
+		lib.include(mod)
+	data = CORE[key] = pickle.dumps(lib, pickle.HIGHEST_PROTOCOL)
+	cache.write('core', key, data)
+	return data
+
+def core():
+	'''Returns a Module containing the core library, as parsed and lowered
+	to CFGs by the blocks phase. Since this is the same for every program,
+	it is cached on disk (see the cache module), keyed on the contents of
+	the core library files and the compiler version. The pickled form is
+	also kept in memory, and every call returns a fresh copy: the passes
+	change the Module in place.'''
+	key, jobs = library()
+	data = cached(key)
+	if data is None:
+		util.note('core library: cache miss (%s)' % key[:12])
+		data = combine(key, modules(jobs))
+	return pickle.loads(data)
+
+def merge(mod, external=False):
+	'''Merge AST Modules for core library files into the given Module. If
+	`external` is set, the core library is only declared (see include()).
+	If the Module is the whole program, code from the core library that it
+	cannot reach is left out (see the reach module).'''
+	from . import reach
+	roots = len(mod.code)
+	mod.include(core(), external)
+	if reach.ENABLED and not external and mod.name is None and not mod.deps:
+		reach.prune(mod, roots)
+
+def load(fn):
+	'''Parse the given file and lower it to a Module of CFGs. If the core
+	library is not cached yet, its files are parsed along with this one.'''
+	key, jobs = library()
+	if cached(key) is not None:
+		return modules([('Runa', fn)])[0]
+	util.note('core library: cache miss (%s)' % key[:12])
+	mods = modules([('Runa', fn)] + jobs)
+	combine(key, mods[1:])
+	return mods[0]
+
+def prepare(fn):
+	'''Load the main module of the program in `fn`, binding the names it
+	imports from other modules (see the program module)'''
+	from . import program
+	units, mods = program.units(fn)
+	return program.module(units[-1], units, mods)
 
 def show(fn, last):
 	'''Show Runa high-level intermediate representation for the source code
@@ -35,14 +168,15 @@ def show(fn, last):
 	
 	Returns a dict with function names (string or tuple) -> IR (string).
 	Functions from modules other than the given module are ignored.'''
-	mod = blocks.Module(parser.parse('Runa', fn))
+	from . import pretty
+	mod = prepare(fn)
 	names = [name for (name, code) in mod.code]
 	
-	merge(mod)
-	for name, fun in util.items(PASSES):
-		fun(mod)
-		if name == last:
-			break
+	with stats.Phase('merge', obj=mod):
+		merge(mod)
+	for name, fun in passes(last):
+		with stats.Phase(name, obj=mod):
+			fun(mod)
 	
 	data = []
 	for name, code in mod.code:
@@ -52,40 +186,281 @@ def show(fn, last):
 	
 	return data
 
-def ir(fn):
+def stream(fn):
 	'''Generate LLVM IR for the given module. Takes a string file name and
-	returns a string of LLVM IR, for the host architecture.'''
-	mod = blocks.Module(parser.parse('Runa', fn))
-	merge(mod)
-	for name, fun in util.items(PASSES):
-		fun(mod)
-	return codegen.generate(mod)
-
-def compile(ir, outfn):
-	'''Compiles LLVM IR into a binary. Takes a string file name and a string
-	output file name. Writes the IR to a temporary file, then calls clang on
-	it. (Shelling out to clang is pretty inefficient.)'''
+	returns an iterator over chunks of LLVM IR, for the host architecture.
+	The passes are run one function at a time; if caching is enabled, IR for
+	unchanged functions is reused (see the incremental module). Code for
+	each function is generated as the iterator is consumed. If the program
+	imports other modules, this is the IR for the main module (see build()).'''
+	from . import incremental
+	mod = prepare(fn)
+	with stats.Phase('merge', obj=mod):
+		merge(mod)
+	return incremental.stream(mod)
+
+def ir(fn):
+	'''Like stream(), but returns the LLVM IR as a single string'''
+	return ''.join(stream(fn))
+
+# Optimization levels accepted by compile(), with the clang-cl equivalents
+LEVELS = {'0': '/Od', '1': '/O1', '2': '/O2', '3': '/Ox', 's': '/Os'}
+
+def pipeline(commands, chunks=None):
+	'''Run the `commands`, with the output of each one piped into the next.
+	If `chunks` is an iterator over strings, they are written to the input
+	of the first one as they come in. Returns True if all of the commands
+	succeeded.'''
+	
+	procs = []
+	try:
+		for cmd in commands:
+			util.note(' '.join(cmd))
+			src = procs[-1].stdout if procs else None
+			if not procs and chunks is not None:
+				src = subprocess.PIPE
+			out = subprocess.PIPE if cmd is not commands[-1] else None
+			procs.append(subprocess.Popen(cmd, stdin=src, stdout=out))
+	except OSError as e:
+		for proc in procs:
+			proc.kill()
+			proc.wait()
+		if e.errno == errno.ENOENT:
+			print('error: %s not found' % cmd[0])
+			return False
+		raise
 	
+	for proc in procs[:-1]:
+		proc.stdout.close() # only the next command reads from it
+	
+	dst = procs[0].stdin
+	try:
+		for chunk in chunks or ():
+			dst.write(chunk.encode('ascii'))
+	except (IOError, OSError) as e:
+		if e.errno != errno.EPIPE: # the command exited early
+			raise
+	except BaseException:
+		for proc in procs:
+			proc.kill()
+		raise
+	finally:
+		if dst is not None:
+			try:
+				dst.close()
+			except (IOError, OSError):
+				pass
+		codes = [proc.wait() for proc in procs]
+	
+	return not any(codes)
+
+def compile(ir, outfn, level=None, arch=None, cpu=None, passes=None,
+            link=True):
+	'''Compiles LLVM IR into a binary. Takes LLVM IR (either a string or an
+	iterator over chunks of IR, as returned by stream()) and a string output
+	file name. The IR is piped into clang as it comes in, so that clang can
+	start parsing while the rest of the IR is being generated.
+	
+	`level` is an optimization level ('0' to '3' or 's'), `arch` and `cpu`
+	are passed to clang as -march and -mcpu. If `passes` is a list of LLVM
+	pass names, the IR is first piped through opt with those passes. If
+	`link` is False, an object file is built rather than a binary.
+	Returns a list of the commands used, so that the options can be
+	recorded.'''
+	
+	if level is not None and level not in LEVELS:
+		raise ValueError('invalid optimization level %r' % level)
+	
+	chunks = iter([ir] if isinstance(ir, str) else ir)
+	first = next(chunks)
+	triple = re.search('triple = "(.*?)"', first).groups()[0]
+	chunks = itertools.chain([first], chunks)
+	
+	commands = []
+	if passes:
+		commands.append(['opt', '-S'] + ['-' + p for p in passes])
+	
+	flags = ['-march=' + arch] if arch else []
+	flags += ['-mcpu=' + cpu] if cpu else []
+	if 'windows-msvc' not in triple:
+		cmd = ['clang', '-x', 'ir', '-o', outfn] + ([] if link else ['-c'])
+		cmd.append('-m64' if triple.split('-')[0] == 'x86_64' else '-m32')
+		cmd += ['-O' + level] if level is not None else []
+		commands.append(cmd + flags + ['-'])
+		with stats.Phase('clang'):
+			pipeline(commands, chunks)
+		return commands
+	
+	# clang-cl does not read from stdin, so write the IR to a file
 	name = outfn + '.ll'
-	with open(name, 'wb') as f:
-		f.write(ir.encode('ascii'))
+	try:
+		
+		if commands:
+			commands[0] += ['-o', name]
+			with stats.Phase('opt'):
+				done = pipeline(commands, chunks)
+			if not done:
+				return commands
+		else:
+			with open(name, 'wb') as f:
+				for chunk in chunks:
+					f.write(chunk.encode('ascii'))
+		
+		cmd = ['clang-cl', ('-Fe' if link else '-Fo') + outfn, '-m64']
+		cmd += [LEVELS[level]] if level is not None else []
+		cmd += flags + ([name, '/link', 'msvcrt.lib'] if link else ['/c', name])
+		commands.append(cmd)
+		with stats.Phase('clang'):
+			pipeline(commands[-1:])
 	
-	triple = re.search('triple = "(.*?)"', ir).groups()[0]
+	finally:
+		if os.path.exists(name):
+			os.unlink(name)
+	
+	return commands
+
+def link(objects, outfn):
+	'''Link the object files in `objects` into a binary. Returns the command
+	used.'''
+	from . import codegen
+	triple = codegen.target()[1]
 	if 'windows-msvc' in triple:
-		cmd = ['clang-cl', '-Fe' + outfn, '-m64', name, '/link', 'msvcrt.lib']
+		cmd = ['clang-cl', '-Fe' + outfn, '-m64'] + objects
+		cmd += ['/link', 'msvcrt.lib']
 	else:
 		cmd = ['clang', '-o', outfn]
 		cmd.append('-m64' if triple.split('-')[0] == 'x86_64' else '-m32')
-		cmd.append(name)
+		cmd += objects
+	with stats.Phase('link'):
+		pipeline([cmd])
+	return cmd
+
+# Number of functions each compilation unit should get at least before a
+# module is split into units that are compiled in parallel (see split())
+UNIT = 100
+
+def assemble(job):
+	'''Compile one unit of IR to an object file. Takes a tuple with the
+	arguments for compile(); this runs in the worker processes of split(),
+	so both the argument and the result are pickled.'''
+	return compile(*job)
+
+def split(mod, count, outfn, level=None, arch=None, cpu=None, passes=None):
+	'''Compile the Module `mod` into a binary as up to `count` compilation
+	units (see ``codegen.CodeGen.split()``), taking the same options as
+	compile(). The units are compiled to object files in a pool of worker
+	processes, then linked. The object for a unit is taken from the cache if
+	its IR did not change. Returns a list of the commands used.'''
 	
+	from . import incremental
+	irs = incremental.split(mod, count)
+	options = repr((level, arch, cpu, passes))
+	commands, objects, jobs, keys = [], [], [], []
+	dir = tempfile.mkdtemp()
 	try:
-		subprocess.check_call(cmd)
-	except OSError as e:
-		if e.errno == 2:
-			print('error: clang not found')
+		
+		for ir in irs:
+			obj = os.path.join(dir, '%i.o' % len(objects))
+			objects.append(obj)
+			key = cache.digest(cache.version(), ir, options)
+			data = cache.read('unit', key)
+			if data is not None:
+				with open(obj, 'wb') as f:
+					f.write(data)
+				continue
+			jobs.append((ir, obj, level, arch, cpu, passes, False))
+			keys.append(key)
+		
+		bits = len(irs) - len(jobs), len(irs)
+		util.note('units: %i of %i from cache' % bits)
+		if len(jobs) > 1:
+			pool = multiprocessing.Pool(min(count, len(jobs)))
+			try:
+				with stats.Phase('clang'):
+					done = pool.map(assemble, jobs, 1)
+			finally:
+				pool.terminate()
+				pool.join()
 		else:
-			raise
-	except subprocess.CalledProcessError:
-		pass
+			done = [assemble(job) for job in jobs]
+		
+		for job, key, cmds in zip(jobs, keys, done):
+			commands += cmds
+			if not os.path.exists(job[1]):
+				return commands
+			with open(job[1], 'rb') as f:
+				cache.write('unit', key, f.read())
+		
+		commands.append(link(objects, outfn))
+	
+	finally:
+		shutil.rmtree(dir)
+	
+	return commands
+
+def build(fn, outfn, level=None, arch=None, cpu=None, passes=None):
+	'''Compile the program with main module `fn` into a binary, taking the
+	same options as compile(). If the program imports other modules (see
+	the program module), each module is compiled to an object file, which is
+	taken from the cache if neither the module nor the interfaces of the
+	modules it depends on changed, and the objects are linked. A program
+	made up of a single module with many functions is split into units that
+	are compiled in parallel (see split()). Returns a list of the commands
+	used. Afterwards, the types built for the program are released (see
+	``types.reset()``).'''
+	
+	from . import types
+	try:
+		from . import incremental, program
+		units, mods = program.units(fn)
+		if len(units) == 1:
+			mod = program.module(units[0], units, mods)
+			with stats.Phase('merge', obj=mod):
+				merge(mod)
+			count = workers(len(mod.code) // UNIT)
+			if count > 1:
+				return split(mod, count, outfn, level, arch, cpu, passes)
+			ir = incremental.stream(mod)
+			return compile(ir, outfn, level, arch, cpu, passes)
+		
+		# bind all names before compiling anything, to report errors early
+		todo = []
+		for unit in units:
+			key = program.key(unit, units, level, arch, cpu, passes)
+			data = cache.read('object', key)
+			mod = program.module(unit, units, mods) if data is None else None
+			todo.append((unit, key, data, mod))
+		
+		commands, objects = [], []
+		dir = tempfile.mkdtemp()
+		try:
+			for unit, key, data, mod in todo:
+				
+				obj = os.path.join(dir, '%i.o' % len(objects))
+				if data is not None:
+					util.note('%s: object from cache' % unit.fn)
+					with open(obj, 'wb') as f:
+						f.write(data)
+					objects.append(obj)
+					continue
+				
+				with stats.Phase('merge', obj=mod):
+					merge(mod, unit.name is not None)
+				ir = incremental.stream(mod)
+				commands += compile(ir, obj, level, arch, cpu, passes, False)
+				if not os.path.exists(obj):
+					return commands
+				
+				with open(obj, 'rb') as f:
+					cache.write('object', key, f.read())
+				objects.append(obj)
+			
+			commands.append(link(objects, outfn))
+		
+		finally:
+			shutil.rmtree(dir)
+		
+		return commands
+	
 	finally:
-		os.unlink(name)
+		types.reset() # do not keep them alive in a long-running process
@@ -2,7 +2,7 @@
 
 from __future__ import print_function
 import optparse, sys, os
-from runac import util
+from runac import util, cache, stats
 import runac
 
 def tokens(fn, opts):
@@ -22,17 +22,35 @@ def show(fn, opts):
 
 def generate(fn, opts):
 	'''Print LLVM IR as generated by the code generation process'''
-	ir = runac.ir(fn)
+	for chunk in runac.stream(fn):
+		if not opts.test:
+			sys.stdout.write(chunk)
 	if not opts.test:
-		print(ir)
+		print()
 
 def compile(fn, opts):
 	'''Compile the given program to a binary of the same name'''
-	ir = runac.ir(fn)
-	if opts.outfile:
-		runac.compile(ir, opts.outfile)
-	else:
-		runac.compile(ir, os.path.basename(fn).rsplit('.rns')[0])
+	
+	out = opts.outfile or os.path.basename(fn).rsplit('.rns')[0]
+	passes = opts.passes.split(',') if opts.passes else None
+	if not opts.server:
+		runac.build(fn, out, opts.level, opts.march, opts.mcpu, passes)
+		return
+	
+	from runac import server
+	res = server.request({
+		'file': fn, 'outfile': out, 'level': opts.level, 'passes': passes,
+		'march': opts.march, 'mcpu': opts.mcpu, 'verbose': opts.verbose,
+		'cache': opts.cache,
+	}, opts.socket)
+	sys.stderr.write(res['diagnostics'])
+	if res['output'] is None:
+		sys.exit(1)
+
+def serve(fn, opts):
+	'''Run a compile server, for use with compile --server'''
+	from runac import server
+	server.serve(fn or opts.socket)
 
 COMMANDS = {
 	'tokens': tokens,
@@ -40,6 +58,7 @@ COMMANDS = {
 	'show': show,
 	'generate': generate,
 	'compile': compile,
+	'serve': serve,
 }
 
 def find(cmd):
@@ -55,17 +74,42 @@ def find(cmd):
 		return lambda x, y: None
 
 if __name__ == '__main__':
-	
+
 	parser = optparse.OptionParser()
 	
 	parser.add_option('--last', help='last pass', default='destruct')
 	parser.add_option('--outfile', '-o', help='output file', dest="outfile")
 	parser.add_option('--test', help='no output', action='store_true')
+	parser.add_option('-O', help='optimization level (0-3 or s)',
+	                  dest='level', choices=sorted(runac.LEVELS))
+	parser.add_option('--march', help='target architecture for clang')
+	parser.add_option('--mcpu', help='target CPU for clang')
+	parser.add_option('--passes', help='comma-separated LLVM passes for opt')
+	parser.add_option('-j', '--jobs', type='int', metavar='N',
+	                  help='worker processes (default: one per CPU)')
+	parser.add_option('--server', help='compile using a running server',
+	                  action='store_true')
+	parser.add_option('--socket', help='socket for the compile server')
 	parser.add_option('--traceback', help='show full traceback',
 	                  action='store_true')
+	parser.add_option('--verbose', '-v', help='show diagnostic messages',
+	                  action='store_true')
+	parser.add_option('--no-cache', help='do not use cached artifacts',
+	                  action='store_false', dest='cache', default=True)
+	parser.add_option('--time-passes', help='report time spent per phase',
+	                  action='store_true')
+	parser.add_option('--mem-passes', help='report peak memory per phase',
+	                  action='store_true')
+	parser.add_option('--stats-json', help='write phase statistics as JSON',
+	                  metavar='FILE')
 	opts, args = parser.parse_args()
+	util.VERBOSE = opts.verbose
+	cache.ENABLED = cache.ENABLED and opts.cache
+	runac.JOBS = opts.jobs
+	if opts.time_passes or opts.mem_passes or opts.stats_json:
+		stats.enable(True, opts.mem_passes)
 	
-	if len(args) < 1:
+	if len(args) < 2 and not (args and find(args[0]) is serve):
 		print('The Runa compiler. A command takes a single file as an argument.')
 		print('\nCommands:\n')
 		for cmd, fun in sorted(COMMANDS.items()):
@@ -75,7 +119,7 @@ if __name__ == '__main__':
 		sys.exit(1)
 	
 	try:
-		find(args[0])(args[1], opts)
+		find(args[0])(args[1] if len(args) > 1 else None, opts)
 	except util.Error as e:
 		if opts.traceback:
 			raise
@@ -84,3 +128,8 @@ if __name__ == '__main__':
 		if opts.traceback:
 			raise
 		sys.stderr.write(e.show())
+	
+	if opts.time_passes or opts.mem_passes:
+		stats.report()
+	if opts.stats_json:
+		stats.dump(opts.stats_json)
@@ -4,6 +4,8 @@ All classes have a `pos` field containing location information. It can be
 None in nodes that have been inserted by the compiler. Classes should have
 a `fields` attribute containing a sequence of properties that either contain
 another AST node or a list of AST nodes, so we can walk the tree somehow.
+All attributes are declared in `__slots__`, which includes the ones added
+by later passes (like `type` or `fun`); nodes are hashed by identity.
 
 Some node types are defined in other modules:
 
@@ -28,13 +30,12 @@ class Registry(type):
 
 class Node(util.AttribRepr):
 	__metaclass__ = Registry
+	__slots__ = 'pos',
 	def __init__(self, pos):
 		self.pos = pos
-	def __hash__(self):
-		values = tuple(sorted((k, v) for (k, v) in util.items(self.__dict__)))
-		return hash((self.__class__.__name__,) + values)
 
 class Expr(Node):
+	__slots__ = 'type', 'escapes'
 	fields = ()
 	def __init__(self, pos):
 		Node.__init__(self, pos)
@@ -42,182 +43,235 @@ class Expr(Node):
 		self.escapes = False
 
 class NoneVal(Expr):
-	pass
+	__slots__ = ()
 
 class Bool(Expr):
+	__slots__ = 'val',
 	def __init__(self, val, pos):
 		Expr.__init__(self, pos)
 		self.val = True if val == 'True' else False
 
 class Int(Expr):
+	__slots__ = 'val',
 	def __init__(self, num, pos):
 		Expr.__init__(self, pos)
 		self.val = num
 
 class Float(Expr):
+	__slots__ = 'val',
 	def __init__(self, num, pos):
 		Expr.__init__(self, pos)
 		self.val = num
 
 class String(Expr):
+	__slots__ = 'val',
 	def __init__(self, value, pos):
 		Expr.__init__(self, pos)
 		self.val = value
 
 class Name(Expr):
+	__slots__ = 'name',
 	def __init__(self, name, pos):
 		Expr.__init__(self, pos)
-		self.name = name
+		self.name = util.intern(name) # shared by all uses of the variable
 
 # Expression-level
 
 class Attrib(Expr):
+	__slots__ = 'obj', 'attrib'
 	fields = 'obj',
 
 class Elem(Expr):
+	__slots__ = 'obj', 'key'
 	fields = 'obj', 'key'
 
 class Add(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Sub(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Mul(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Div(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Mod(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class BWAnd(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class BWOr(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class BWXor(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Not(Expr):
+	__slots__ = 'value',
 	fields = 'value',
 
 class Owner(Expr):
+	__slots__ = 'value',
 	fields = 'value'
 
 class Ref(Expr):
+	__slots__ = 'value',
 	fields = 'value'
 
 class Opt(Expr):
+	__slots__ = 'value',
 	fields = 'value'
 
 class In(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class And(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Or(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Is(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class EQ(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class NE(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class LT(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class GT(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class As(Expr):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Tuple(Expr):
+	__slots__ = 'values',
 	fields = 'values',
 
 class Call(Expr):
+	__slots__ = 'name', 'args', 'fun', 'virtual', 'callbr'
 	fields = 'args',
 
 # Statement-level
 
 class Assign(Node):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class IAdd(Node):
+	__slots__ = 'left', 'right'
 	fields = 'left', 'right'
 
 class Raise(Node):
+	__slots__ = 'value',
 	fields = 'value',
 
 class Yield(Node):
+	__slots__ = 'value', 'target'
 	fields = 'value',
 
 class Except(Node):
+	__slots__ = 'type', 'suite'
 	fields = 'type', 'suite'
 
 class Suite(Node):
+	__slots__ = 'stmts',
 	fields = 'stmts',
 
 class Argument(Node):
+	__slots__ = 'name', 'type'
 	fields = 'name',
 	def __init__(self, pos):
 		Node.__init__(self, pos)
 		self.type = None
 
 class Decl(Node):
+	__slots__ = 'decor', 'name', 'args', 'rtype', 'irname'
 	fields = 'decor', 'name', 'args', 'rtype'
 
 class TryBlock(Node):
+	__slots__ = 'suite', 'catch'
 	fields = 'suite', 'catch'
 
 class Function(Node):
+	__slots__ = 'decor', 'name', 'args', 'rtype', 'suite', 'flow', 'irname'
 	fields = 'decor', 'name', 'args', 'rtype', 'suite'
 
 class Break(Node):
+	__slots__ = ()
 	fields = ()
 
 class Continue(Node):
+	__slots__ = ()
 	fields = ()
 
 class Pass(Node):
+	__slots__ = ()
 	fields = ()
 
 class Return(Node):
+	__slots__ = 'value',
 	fields = 'value',
 
 class Ternary(Expr):
+	__slots__ = 'cond', 'values'
 	fields = 'cond', 'values'
 
 class If(Node):
+	__slots__ = 'blocks',
 	fields = 'blocks',
 
 class Import(Node):
+	__slots__ = 'names',
 	fields = 'names',
 
 class RelImport(Node):
+	__slots__ = 'base', 'names'
 	fields = 'base', 'names'
 
 class For(Node):
+	__slots__ = 'lvar', 'source', 'suite'
 	fields = 'lvar', 'source', 'suite'
 
 class While(Node):
+	__slots__ = 'cond', 'suite'
 	fields = 'cond', 'suite'
 
 class Class(Node):
+	__slots__ = 'decor', 'name', 'params', 'attribs', 'methods'
 	fields = 'decor', 'name', 'params', 'attribs', 'methods'
 
 class Trait(Node):
+	__slots__ = 'decor', 'name', 'params', 'methods'
 	fields = 'decor', 'name', 'params', 'methods'
 
 class File(Node):
+	__slots__ = 'suite',
 	fields = 'suite',
 	def __init__(self):
 		self.suite = []
@@ -21,17 +21,20 @@ into a control flow graph of basic blocks.
 '''
 
 from . import ast, util, types
+from array import array
 import copy
 
 class SetAttr(ast.Attrib):
-	pass
+	__slots__ = ()
 
 class Branch(util.AttribRepr):
+	__slots__ = 'label',
 	fields = ()
 	def __init__(self, target):
 		self.label = target
 
 class CondBranch(util.AttribRepr):
+	__slots__ = 'cond', 'tg1', 'tg2'
 	fields = ('cond',)
 	def __init__(self, cond, tg1, tg2):
 		self.cond = cond
@@ -39,6 +42,7 @@ class CondBranch(util.AttribRepr):
 		self.tg2 = tg2
 
 class Phi(util.AttribRepr):
+	__slots__ = 'pos', 'left', 'right', 'type'
 	fields = ()
 	def __init__(self, pos, left, right):
 		self.pos = pos
@@ -51,12 +55,14 @@ class Constant(object):
 		self.node = node
 
 class LoopSetup(util.AttribRepr):
+	__slots__ = 'loop', 'type'
 	fields = 'loop',
 	def __init__(self, loop):
 		self.loop = loop
 		self.type = None
 
 class LoopHeader(util.AttribRepr):
+	__slots__ = 'ctx', 'lvar', 'tg1', 'tg2'
 	fields = 'ctx', 'lvar'
 	def __init__(self, ctx, lvar, tg1, tg2):
 		self.ctx = ctx
@@ -65,23 +71,39 @@ class LoopHeader(util.AttribRepr):
 		self.tg2 = tg2
 
 class LPad(util.AttribRepr):
+	__slots__ = 'map',
 	fields = ()
 	def __init__(self, map):
 		self.map = map
 
 class Block(util.AttribRepr):
+	__slots__ = (
+		'id', 'anno', 'flow', 'returns', 'raises', 'steps',
+		'assigns', 'uses', 'origin', 'escapes', 'checks',
+	)
 	
-	def __init__(self, id, anno=None):
+	def __init__(self, id, anno=None, flow=None):
 		self.id = id
 		self.anno = anno
+		self.flow = flow
 		self.returns = False
 		self.raises = False
 		self.steps = []
-		self.preds = []
 		self.assigns = None
 		self.uses = None
+		self.origin = None
 		self.escapes = {}
-		self.checks = {}
+		self.checks = None
+	
+	def __repr__(self):
+		return '<Block(%s, %r)>' % (self.id, self.anno)
+	
+	@property
+	def preds(self):
+		'''The blocks with edges to this one, ordered by ID'''
+		flow = self.flow
+		lo, hi = flow.poff[self.id], flow.poff[self.id + 1]
+		return [flow.blocks[i] for i in flow.pred[lo:hi]]
 	
 	def push(self, inst):
 		self.steps.append(inst)
@@ -89,23 +111,133 @@ class Block(util.AttribRepr):
 	def needbranch(self):
 		return not self.steps or not isinstance(self.steps[-1], ast.Return)
 
+class Blocks(object):
+	'''The blocks of a FlowGraph, in a list indexed by block ID. This can
+	be used like a dict mapping IDs to blocks, but iterates in ID order.
+	Removing a block other than the last one leaves a hole in the list
+	until the blocks are renumbered (see ``simplify.compact()``).'''
+	__slots__ = 'list', 'count'
+	
+	def __init__(self):
+		self.list = []
+		self.count = 0
+	
+	def __len__(self):
+		return self.count
+	
+	def __contains__(self, id):
+		return isinstance(id, int) and 0 <= id < len(self.list) \
+			and self.list[id] is not None
+	
+	def __iter__(self):
+		return (i for (i, bl) in enumerate(self.list) if bl is not None)
+	
+	def __getitem__(self, id):
+		if id not in self:
+			raise KeyError(id)
+		return self.list[id]
+	
+	def __setitem__(self, id, bl):
+		if id >= len(self.list):
+			self.list += [None] * (id + 1 - len(self.list))
+		self.count += self.list[id] is None
+		self.list[id] = bl
+	
+	def __delitem__(self, id):
+		self.pop(id)
+	
+	def pop(self, id):
+		bl = self[id]
+		self.list[id] = None
+		self.count -= 1
+		while self.list and self.list[-1] is None:
+			self.list.pop()
+		return bl
+	
+	def get(self, id, default=None):
+		return self.list[id] if id in self else default
+	
+	def keys(self):
+		return list(self)
+	
+	def values(self):
+		return [bl for bl in self.list if bl is not None]
+	
+	def items(self):
+		return [(i, bl) for (i, bl) in enumerate(self.list) if bl is not None]
+	
+	iterkeys, itervalues, iteritems = keys, values, items
+
 class FlowGraph(util.AttribRepr):
+	'''A CFG for a single function. Edges are added with edge() while the
+	graph is built; link() then packs them into arrays of block IDs: the
+	successors of block ``i`` are ``succ[soff[i]:soff[i + 1]]``, and its
+	predecessors are ``pred[poff[i]:poff[i + 1]]``. The ``edges`` property
+	returns the edges as a dict mapping block IDs to lists of successors.'''
+	__slots__ = 'blocks', 'pending', 'yields', 'checks', 'succ', 'soff', 'pred', 'poff'
 	
 	def __init__(self):
-		self.blocks = {0: Block(0, 'entry')}
-		self.edges = {}
+		self.blocks = Blocks()
+		self.blocks[0] = Block(0, 'entry', self)
+		self.pending = {}
 		self.yields = {}
 		self.checks = {}
+		self.succ = self.soff = self.pred = self.poff = None
 	
 	def block(self, anno=None):
-		id = len(self.blocks)
-		self.blocks[id] = Block(id, anno)
+		id = len(self.blocks.list)
+		self.blocks[id] = Block(id, anno, self)
 		return self.blocks[id]
 	
 	def edge(self, src, dst, checked=None):
-		self.edges.setdefault(src, []).append(dst)
+		self.pending.setdefault(src, []).append(dst)
 		if checked:
 			self.checks[src, dst] = {n.name: chk for (n, chk) in checked}
+	
+	@property
+	def edges(self):
+		if self.succ is None:
+			return self.pending
+		res = {}
+		for id in self.blocks:
+			lo, hi = self.soff[id], self.soff[id + 1]
+			if lo < hi:
+				res[id] = list(self.succ[lo:hi])
+		return res
+	
+	def succs(self, id):
+		'''Returns an array of the IDs of the successors of block `id`'''
+		return self.succ[self.soff[id]:self.soff[id + 1]]
+	
+	def preds(self, id):
+		'''Returns an array of the IDs of the predecessors of block `id`'''
+		return self.pred[self.poff[id]:self.poff[id + 1]]
+	
+	def link(self, edges=None):
+		'''Pack the `edges` (a dict mapping block IDs to lists of successor
+		IDs; by default, the edges added with edge()) into the arrays.'''
+		
+		edges = self.pending if edges is None else edges
+		size = len(self.blocks.list)
+		succ, soff, count = array('i'), array('i', [0]), [0] * (size + 1)
+		for id in range(size):
+			for dst in edges.get(id, ()):
+				succ.append(dst)
+				count[dst + 1] += 1
+			soff.append(len(succ))
+		
+		poff = array('i', [0]) * (size + 1)
+		for id in range(size):
+			poff[id + 1] = poff[id] + count[id + 1]
+		
+		pred, fill = array('i', [0]) * len(succ), array('i', poff)
+		for id in range(size):
+			for dst in succ[soff[id]:soff[id + 1]]:
+				pred[fill[dst]] = id
+				fill[dst] += 1
+		
+		self.succ, self.soff, self.pred, self.poff = succ, soff, pred, poff
+		self.pending = None
 
 ATOMIC = ast.NoneVal, ast.Bool, ast.Int, ast.Float, ast.Name
 
@@ -412,7 +544,7 @@ class FlowFinder(object):
 	
 	def While(self, node):
 		
-		self.branched = {}
+		outer, self.branched = self.branched, {}
 		head = self.flow.block('while-head')
 		body = self.flow.block('while-body')
 		self.cur.push(Branch(head.id))
@@ -437,11 +569,11 @@ class FlowFinder(object):
 			n.label = head.id
 		for n in self.branched.get('break', []):
 			n.label = exit.id
-		self.branched = None
+		self.branched = outer
 	
 	def For(self, node):
 		
-		self.branched = {}
+		outer, self.branched = self.branched, {}
 		head = self.flow.block('for-head')
 		body = self.flow.block('for-body')
 		
@@ -469,7 +601,7 @@ class FlowFinder(object):
 			n.label = head.id
 		for n in self.branched.get('break', []):
 			n.label = exit.id
-		self.branched = None
+		self.branched = outer
 	
 	def TryBlock(self, node):
 		
@@ -523,17 +655,28 @@ class FlowFinder(object):
 			final.steps.append(auto)
 			final.returns = True
 		
-		for src, dsts in util.items(flow.edges):
-			for dst in dsts:
-				flow.blocks[dst].preds.append(flow.blocks[src])
+		flow.link()
 
 FINAL = ast.Return, ast.Raise, Branch, CondBranch, ast.Yield, LoopHeader, LPad
 
+def dotted(node):
+	'''Returns the dotted name for a Name node or a chain of Attribs'''
+	res = []
+	while isinstance(node, ast.Attrib):
+		res.append(node.attrib)
+		node = node.obj
+	res.append(node.name)
+	return '.'.join(reversed(res))
+
 class Module(object):
 	
 	def __init__(self, node=None):
+		self.name = None # set for modules imported by the program
 		self.names = {}
+		self.imports = {}
 		self.code = []
+		self.external = [] # code objects compiled in another module
+		self.deps = [] # names of the modules it imports (see program)
 		self.variants = set() # populated by type inferencing pass
 		self.scope = None # populated by type inferencing pass
 		self.types = types.TypeMap()
@@ -545,25 +688,25 @@ class Module(object):
 		show = ('%s=%s' % (k, v) for (k, v) in contents)
 		return '<%s(%s)>' % (self.__class__.__name__, ', '.join(show))
 	
+	def include(self, other, external=False):
+		'''Add the names and code from another Module to this one, as if
+		the other Module's source files had been merged in. If `external`
+		is set, the code is compiled elsewhere: it is only declared.'''
+		self.names.update(other.names)
+		if external:
+			self.external += other.code
+		else:
+			self.code += other.code
+	
 	def merge(self, node):
 		
 		code = []
 		for n in node.suite:
 			
 			if isinstance(n, ast.RelImport):
+				base = dotted(n.base)
+				self.imports.setdefault(base, []).extend(n.names)
 				for name in n.names:
-					
-					if isinstance(n.base, ast.Name):
-						base = n.base.name
-					else:
-						start = n.base
-						res = []
-						while isinstance(start, ast.Attrib):
-							res.append(start.attrib)
-							start = start.obj
-						res.append(start.name)
-						base = '.'.join(reversed(res))
-					
 					self.names[name.name] = base + '.' + name.name
 			
 			elif isinstance(n, ast.Class):
@@ -0,0 +1,100 @@
+'''A small on-disk cache for compiler artifacts.
+
+Entries are stored in a per-user cache directory, which can be overridden
+by setting the ``RUNA_CACHE_DIR`` environment variable. Keys are content
+hashes: callers hash everything an artifact depends on (including the
+compiler itself, see ``version()``), so a stale entry is never found
+rather than having to be invalidated explicitly.
+
+Failures to read or write the cache are never fatal; the compiler just does
+the work it would have done without a cache.
+'''
+
+from . import util
+import os, sys, hashlib, tempfile
+
+ENABLED = not os.environ.get('RUNA_NO_CACHE')
+VERSION = []
+
+def directory():
+	'''Returns the directory used for cache files (it might not exist)'''
+	
+	if os.environ.get('RUNA_CACHE_DIR'):
+		return os.environ['RUNA_CACHE_DIR']
+	
+	if sys.platform == 'darwin':
+		base = os.path.expanduser('~/Library/Caches')
+	elif sys.platform == 'win32':
+		base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+	else:
+		default = os.path.join(os.path.expanduser('~'), '.cache')
+		base = os.environ.get('XDG_CACHE_HOME', default)
+	
+	return os.path.join(base, 'runa')
+
+def digest(*parts):
+	'''Returns a hex digest of the given strings (or bytes)'''
+	h = hashlib.sha1()
+	for part in parts:
+		if not isinstance(part, bytes):
+			part = part.encode('utf-8')
+		h.update(part)
+		h.update(b'\0')
+	return h.hexdigest()
+
+def version():
+	'''Returns a digest identifying the running compiler: the contents of
+	all of its source files, plus the Python version (which determines the
+	format of pickled artifacts).'''
+	
+	if VERSION:
+		return VERSION[0]
+	
+	parts = [sys.version]
+	src = os.path.dirname(os.path.abspath(__file__))
+	for fn in sorted(os.listdir(src)):
+		if fn.endswith('.py'):
+			with open(os.path.join(src, fn), 'rb') as f:
+				parts += [fn, f.read()]
+	
+	VERSION.append(digest(*parts))
+	return VERSION[0]
+
+def path(kind, key):
+	return os.path.join(directory(), kind, key)
+
+def read(kind, key):
+	'''Returns the bytes stored for `kind` and `key`, or None'''
+	
+	if not ENABLED:
+		return None
+	
+	try:
+		with open(path(kind, key), 'rb') as f:
+			return f.read()
+	except (IOError, OSError):
+		return None
+
+def write(kind, key, data):
+	'''Store `data` (bytes) for `kind` and `key`. Writes go to a temporary
+	file that is then renamed, so concurrent readers never see a partially
+	written entry.'''
+	
+	if not ENABLED:
+		return
+	
+	dst = path(kind, key)
+	base = os.path.dirname(dst)
+	try:
+		if not os.path.isdir(base):
+			try:
+				os.makedirs(base)
+			except OSError:
+				if not os.path.isdir(base):
+					raise
+		fd, tmp = tempfile.mkstemp(dir=base)
+		with os.fdopen(fd, 'wb') as f:
+			f.write(data)
+		os.rename(tmp, dst)
+	except (IOError, OSError) as e:
+		util.note('cache: unable to write %s (%s)' % (dst, e))
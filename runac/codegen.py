@@ -21,8 +21,8 @@ over the life of one Runa process would be important.
 which is important.)
 '''
 
-from . import ast, types, blocks, typer, util
-import os, sys, copy, platform
+from . import ast, types, blocks, typer, stats, util
+import os, re, sys, platform, zlib
 
 ESCAPES = {'\\n': '\\0a', '\\0': '\\00'}
 
@@ -38,7 +38,7 @@ class Value(util.AttribRepr):
 		self.var = var
 
 class Frame(object):
-	
+
 	def __init__(self, parent=None):
 		self.parent = parent
 		self.defined = {}
@@ -61,10 +61,14 @@ class Frame(object):
 		return self[key] if key in self else default
 
 class CodeGen(object):
-	
-	def __init__(self, mod, word):
+
+	def __init__(self, mod, word, cached=None):
 		self.mod = mod
 		self.word = word
+		self.cached = cached or {}
+		self.decls = {}
+		# imported modules share definitions with the main module
+		self.linkage = 'linkonce_odr ' if mod.name else ''
 		self.level = 0
 		self.start = True
 		self.main = None
@@ -77,9 +81,6 @@ class CodeGen(object):
 	def visit(self, node, frame):
 		return getattr(self, node.__class__.__name__)(node, frame)
 	
-	def generate(self):
-		self.Module(self.mod)
-	
 	# Output helper methods
 	
 	def tabs(self):
@@ -244,9 +245,8 @@ class CodeGen(object):
 			assert len(cmalts) == 1
 			cfun = cmalts[0]
 			
-			tft = copy.copy(tfun.type)
-			tft.over = tft.over[0], list(tft.over[1])
-			tft.over[1][0] = ptrt
+			over = tfun.type.over
+			tft = types.function(over[0], (ptrt,) + tuple(over[1][1:]))
 			
 			cast = self.varname()
 			bits = cast, cfun.type.ir, cfun.decl, tft.ir
@@ -331,7 +331,7 @@ class CodeGen(object):
 			bits = data, dtype, tmp
 			self.writeline('%s = bitcast %s* %s to i8*' % bits)
 			full = self.alloca(t)
-			
+		
 		else:
 			
 			size = self.load(Value(self.mod.types.get('&uint'), '@str.size'))
@@ -494,7 +494,7 @@ class CodeGen(object):
 		
 		left = self.visit(node.left, frame)
 		right = self.visit(node.right, frame)
-		if types.unwrap(left.type) in types.INTS:
+		if types.unwrap(left.type) in types.INTS | types.FLOATS:
 			
 			if isinstance(left.type, types.WRAPPERS):
 				left = self.load(left)
@@ -502,7 +502,10 @@ class CodeGen(object):
 				right = self.load(right)
 			
 			assert left.type == right.type, (left.type, right.type)
-			op = {'div': 'sdiv', 'mod': 'srem'}.get(op, op)
+			if left.type in types.FLOATS:
+				op = 'f' + {'mod': 'rem'}.get(op, op)
+			else:
+				op = {'div': 'sdiv', 'mod': 'srem'}.get(op, op)
 			res = self.varname()
 			bits = res, op, left.type.ir, left.var, right.var
 			self.writeline('%s = %s %s %s, %s' % bits)
@@ -570,7 +573,7 @@ class CodeGen(object):
 		self.store(('i8*', labeladdr), labelslot)
 		
 		ctxt = types.unwrap(ctx.type)
-		for i, name in enumerate(node.loop.source.fun.type.args):
+		for i, name in enumerate(node.loop.source.fun.args):
 			idx = ctxt.attribs[name][0]
 			var = self.visit(node.loop.source.args[i], frame)
 			slot = self.gep(ctx, 0, idx)
@@ -840,8 +843,9 @@ class CodeGen(object):
 			self.writeline('%s = load %s* %s' % (vt, vtt, vtp))
 			fp = self.gep((vtt, vt), 0, 0)
 			
-			ft = copy.copy(node.fun.type)
-			ft.over = ft.over[0], (self.mod.types.get('&byte'),) + ft.over[1][1:]
+			over = node.fun.type.over
+			byte = self.mod.types.get('&byte')
+			ft = types.function(over[0], (byte,) + tuple(over[1][1:]))
 			fun = self.load(Value(types.ref(ft), fp))
 			type, name = fun.type, fun.var
 		
@@ -862,35 +866,43 @@ class CodeGen(object):
 		self.writeline('%s = call %s %s(%s)' % bits)
 		return Value(rtype, res)
 	
-	def Function(self, node, frame):
+	def signature(self, node):
+		'''Returns the IR name, the return type and the arguments (as a
+		list of (type, name) tuples) of the function defined for `node`'''
 		
-		self.vars = 0
-		self.labels.clear()
 		irname = node.name.name
 		if hasattr(node, 'irname'):
 			irname = node.irname
 		
-		ctxt, self.intercept = None, None
-		if node.flow.yields:
-			ctxt = self.mod.types[irname + '$ctx']
-			self.intercept = Value(types.ref(ctxt), '%ctx')
-		
 		rt = node.rtype.ir
 		if irname == 'main' and rt == 'void':
 			rt = 'i32'
 		
-		args = ['%s %%%s' % (a.type.ir, a.name.name) for a in node.args]
+		args = [(a.type.ir, a.name.name) for a in node.args]
 		if irname == 'main' and node.args:
-			args = ['i32 %argc', 'i8** %argv']
-		elif ctxt is not None:
-			args = ['%s %%ctx' % (types.ref(ctxt).ir)]
+			args = [('i32', 'argc'), ('i8**', 'argv')]
+		elif node.flow.yields:
+			ctxt = self.mod.types[irname + '$ctx']
+			args = [(types.ref(ctxt).ir, 'ctx')]
 		
 		if rt.startswith('%tuple$'):
-			args.insert(0, '%s* %%$R' % rt)
+			args.insert(0, (rt + '*', '$R'))
 			rt = 'void'
 		
-		bits = rt, irname, ', '.join(args)
-		self.writeline('define %s @%s(%s) uwtable {' % bits)
+		return irname, rt, args
+	
+	def Function(self, node, frame):
+		
+		self.vars = 0
+		self.labels.clear()
+		irname, rt, args = self.signature(node)
+		ctxt, self.intercept = None, None
+		if node.flow.yields:
+			ctxt = self.mod.types[irname + '$ctx']
+			self.intercept = Value(types.ref(ctxt), '%ctx')
+		
+		args = ', '.join('%s %%%s' % a for a in args)
+		self.writeline('define %s @%s(%s) uwtable {' % (rt, irname, args))
 		self.indent()
 		
 		frame = Frame(frame)
@@ -947,9 +959,10 @@ class CodeGen(object):
 	
 	def const(self, name, val, frame):
 		
+		linkage = 'internal ' if self.linkage else ''
 		if types.unwrap(val.type) != self.mod.types.get('str'):
-			bits = name, types.unwrap(val.type).ir, val.val
-			self.writeline('@%s = constant %s %s' % bits)
+			bits = name, linkage, types.unwrap(val.type).ir, val.val
+			self.writeline('@%s = %sconstant %s %s' % bits)
 			frame[name] = Value(val.type, '@%s' % name)
 			return
 		
@@ -958,12 +971,12 @@ class CodeGen(object):
 		literal = val.val
 		for c, sub in sorted(util.items(ESCAPES)):
 			literal = literal.replace(c, sub)
-			
-		bits = name, dtype, literal
-		self.writeline('@%s.data = constant %s c"%s"' % bits)
+		
+		bits = name, linkage, dtype, literal
+		self.writeline('@%s.data = %sconstant %s c"%s"' % bits)
 		cast = 'i8* bitcast (%s* @%s.data to i8*)' % (dtype, name)
-		bits = name, self.word, slen, cast
-		self.writeline('@%s = constant %%str { %s %s, %s }' % bits)
+		bits = name, linkage, self.word, slen, cast
+		self.writeline('@%s = %sconstant %%str { %s %s, %s }' % bits)
 		frame[name] = Value(val.type, '@%s' % name)
 	
 	def declare(self, ref):
@@ -972,9 +985,14 @@ class CodeGen(object):
 			return
 		
 		rtype = ref.type.over[0].ir
-		args = ', '.join(t.ir for t in ref.type.over[1])
-		self.writeline('declare %s @%s(%s)' % (rtype, ref.decl, args))
+		args = [t.ir for t in ref.type.over[1]]
+		if rtype.startswith('%tuple$'):
+			args.insert(0, rtype + '*')
+			rtype = 'void'
 		
+		bits = rtype, ref.decl, ', '.join(args)
+		self.writeline('declare %s @%s(%s)' % bits)
+	
 	def type(self, type):
 		
 		if isinstance(type, types.WRAPPERS):
@@ -1008,7 +1026,7 @@ class CodeGen(object):
 		t = type.ir
 		gep = '%s* getelementptr (%s* null, i32 1)' % (t, t)
 		cast = 'constant %s ptrtoint (%s to %s)' % (self.word, gep, self.word)
-		self.writeline('@%s.size = %s' % (t[1:], cast))
+		self.writeline('@%s.size = %s%s' % (t[1:], self.linkage, cast))
 		self.newline()
 	
 	def trait(self, t):
@@ -1016,9 +1034,8 @@ class CodeGen(object):
 		mtypes = []
 		for name, malts in sorted(util.items(t.methods)):
 			for fun in malts:
-				ftype = copy.copy(fun.type)
-				atypes = (self.mod.types.get('&byte'),) + ftype.over[1][1:]
-				ftype.over = ftype.over[0], atypes
+				atypes = (self.mod.types.get('&byte'),) + fun.type.over[1][1:]
+				ftype = types.function(fun.type.over[0], tuple(atypes))
 				mtypes.append(ftype.ir)
 		
 		self.writeline('%%%s.vt = type { %s }' % (t.name, ', '.join(mtypes)))
@@ -1027,11 +1044,9 @@ class CodeGen(object):
 	
 	def ctx(self, mod, t):
 		
-		name = t.name[:-4].split('.')
-		key = name[0] if len(name) == 1 else tuple(name)
 		fun = None
 		for k, v in mod.code:
-			if k == key:
+			if v.irname == t.name[:-4]:
 				fun = v
 				break
 		
@@ -1060,12 +1075,20 @@ class CodeGen(object):
 		
 		self.type(t)
 	
-	def Module(self, mod):
+	def header(self, mod):
 		
 		for k, v in util.items(mod.names):
 			if isinstance(v, types.FunctionDef):
 				self.declare(v)
 		
+		for k, fun in mod.external:
+			if isinstance(k, str):
+				self.declare(mod.scope[k])
+				continue
+			for defn in mod.scope[k[0]].methods[k[1]]:
+				if defn.decl == fun.irname:
+					self.declare(defn)
+		
 		self.newline()
 		deps = {}
 		for k, v in util.items(mod.names):
@@ -1080,7 +1103,7 @@ class CodeGen(object):
 		while remains:
 			
 			done = set()
-			for k in remains:
+			for k in sorted(remains):
 				if not deps[k][1]:
 					self.type(deps[k][0])
 					done.add(deps[k][0])
@@ -1097,11 +1120,12 @@ class CodeGen(object):
 			if isinstance(v, types.trait):
 				self.trait(v)
 		
+		for ir, decls in util.values(self.cached):
+			self.decls.update(decls)
 		for var in mod.variants:
-			if var.name.endswith('$ctx'):
-				self.ctx(mod, var)
-			else:
-				self.type(var)
+			self.decls[var.name] = self.typedecl(var)
+		for name in sorted(self.decls):
+			self.buf.append(self.decls[name])
 		
 		frame = Frame()
 		for k, v in util.items(mod.names):
@@ -1110,10 +1134,116 @@ class CodeGen(object):
 		
 		self.typedecls = self.buf
 		self.buf = []
+		return frame
+	
+	def stream(self, store=None):
+		'''Generates the module, yielding chunks of IR: first the target
+		triple, the declarations and the run-time library, then the code
+		for each function as soon as it has been generated. Code for
+		functions in `self.cached` is reused; for the others, `store` (if
+		given) is called with the index of the code object and its IR.'''
+		
+		with stats.Phase('codegen'):
+			frame = self.header(self.mod)
+		
+		yield 'target triple = "%s"\n\n' % target()[1]
+		yield ''.join(self.typedecls)
+		yield self.runtime()
+		yield '\n'
+		
+		for ir in self.functions(frame, store):
+			yield ir
+	
+	def functions(self, frame, store=None):
+		'''Yields the IR for each code object in the module, given the
+		`frame` returned by header() (see stream())'''
+		for i, (k, v) in enumerate(self.mod.code):
+			
+			if i in self.cached:
+				yield self.cached[i][0]
+				continue
+			
+			ir = self.function(k, v, frame)
+			if store is not None:
+				store(i, ir)
+			yield ir
+	
+	def split(self, count, store=None):
+		'''Generates the module as up to `count` compilation units, which
+		can be compiled separately and linked. Returns a list of strings of
+		IR. Each code object goes into a unit picked by a hash of its name,
+		so that a change to one function only changes the unit it is in.
+		All units start with the declarations and the run-time library,
+		whose definitions are linkonce_odr; functions from other units
+		are declared where they are used. `store` is used as in stream().'''
+		
+		self.linkage = 'linkonce_odr '
+		with stats.Phase('codegen'):
+			frame = self.header(self.mod)
+		
+		head = ['target triple = "%s"\n\n' % target()[1]]
+		head.append(shared(''.join(self.typedecls), self.linkage))
+		head += [self.runtime(), '\n']
+		
+		owner, protos = [], {}
+		for k, v in self.mod.code:
+			irname, rt, args = self.signature(v)
+			bits = rt, irname, ', '.join(a[0] for a in args)
+			protos[irname] = 'declare %s @%s(%s)\n' % bits
+			owner.append((irname, zlib.crc32(irname.encode('ascii')) % count))
+		
+		units = [[] for i in range(count)]
+		for i, ir in enumerate(self.functions(frame, store)):
+			units[owner[i][1]].append(ir)
+		
+		where, res = dict(owner), []
+		used = set(re.findall(r'@([\w.$]+)', ''.join(head))) # run-time library
+		for n, code in enumerate(units):
+			
+			if not code:
+				continue
+			
+			code = ''.join(code)
+			refs = sorted(used | set(re.findall(r'@([\w.$]+)', code)))
+			decls = [protos[r] for r in refs if where.get(r, n) != n]
+			decls += ['\n'] if decls else []
+			res.append(''.join(head + decls + [code]))
 		
-		self.newline()
-		for k, v in mod.code:
-			self.visit(v, frame)
+		return res
+	
+	def function(self, name, code, frame):
+		'''Returns the IR for the code object `code`, given the `frame`
+		returned by header()'''
+		self.buf = []
+		with stats.Phase('codegen', name, code):
+			self.visit(code, frame)
+		return ''.join(self.buf)
+	
+	def typedecl(self, t):
+		'''Returns the IR declaring the variant type `t`'''
+		buf, self.buf = self.buf, []
+		if t.name.endswith('$ctx'):
+			self.ctx(self.mod, t)
+		else:
+			self.type(t)
+		buf, self.buf = self.buf, buf
+		return ''.join(buf)
+	
+	def runtime(self):
+		'''Returns the IR for the run-time library. In imported modules,
+		its definitions are linkonce_odr, since every object has them.'''
+		bytes = str(int(self.word[1:]) // 8)
+		with open(os.path.join(util.CORE_DIR, 'rt.ll')) as f:
+			src = f.read().replace('{{ WORD }}', self.word)
+			src = src.replace('{{ BYTES }}', bytes)
+		return shared(src, self.linkage) if self.linkage else src
+
+def shared(src, linkage):
+	'''Returns the IR `src` with the given `linkage` added to its function
+	definitions and constants (but not to constants with other linkage)'''
+	src = re.sub('^define ', 'define ' + linkage, src, flags=re.M)
+	sub = r'\1 = ' + linkage + 'constant'
+	return re.sub(r'^(@\S+) = constant', sub, src, flags=re.M)
 
 TRIPLES = {
 	('64bit', 'darwin'): 'x86_64-apple-macosx10.10.0',
@@ -1122,21 +1252,11 @@ TRIPLES = {
 	('64bit', 'win32'): 'x86_64-pc-windows-gnu',
 }
 
-def generate(mod):
-	
+def target():
+	'''Returns the word type and target triple for the host'''
 	arch, os_key = platform.architecture()[0], sys.platform
-	word = 'i' + arch[:2]
-	gen = CodeGen(mod, word)
-	gen.generate()
-	
 	os_key = 'linux' if os_key.startswith('linux') else os_key
-	code = ['target triple = "%s"\n\n' % TRIPLES[arch, os_key]]
-	code += gen.typedecls
-	
-	with open(os.path.join(util.CORE_DIR, 'rt.ll')) as f:
-		src = f.read().replace('{{ WORD }}', word)
-		src = src.replace('{{ BYTES }}', str(int(arch[:2]) // 8))
-		code.append(src)
-	
-	code += gen.buf
-	return ''.join(code)
+	return 'i' + arch[:2], TRIPLES[arch, os_key]
+
+def generate(mod):
+	return ''.join(CodeGen(mod, target()[0]).stream())
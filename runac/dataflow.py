@@ -0,0 +1,123 @@
+'''A framework for bit-vector dataflow analyses over a function's CFG.
+
+An analysis numbers the facts it tracks (definitions of variables, blocks
+that return, and so on), so that a set of facts is a bitset: an ``int`` with
+bit ``n`` set if fact ``n`` holds. For each block it provides the facts the
+block generates and the facts it kills, and ``solve()`` computes the facts
+holding before and after each block, flowing either forward (from
+predecessors to successors) or backward.
+
+Blocks are visited in reverse postorder of the CFG (or the reverse of that,
+for backward problems), following the edge arrays of the ``FlowGraph`` (see
+``blocks.FlowGraph.link()``), and after the first round only the blocks
+whose inputs changed are visited again, so an analysis typically converges
+after visiting every block two or three times. The number of rounds and block
+visits is recorded per analysis when statistics are enabled (see the stats
+module).
+'''
+
+from . import stats
+
+def order(flow):
+	'''Returns a list of block IDs in reverse postorder, starting from the
+	entry block. Blocks not reachable from the entry block come after the
+	rest, ordered the same way starting from the lowest block ID.'''
+	
+	succ, soff = flow.succ, flow.soff
+	res, seen = [], set()
+	for root in flow.blocks:
+		
+		if root in seen:
+			continue
+		
+		post, stack = [], [(root, iter(succ[soff[root]:soff[root + 1]]))]
+		seen.add(root)
+		while stack:
+			id, dsts = stack[-1]
+			for dst in dsts:
+				if dst not in seen:
+					seen.add(dst)
+					stack.append((dst, iter(succ[soff[dst]:soff[dst + 1]])))
+					break
+			else:
+				stack.pop()
+				post.append(id)
+		
+		res += reversed(post)
+	
+	return res
+
+def members(bits):
+	'''Yields the indexes of the bits set in the bitset `bits`'''
+	while bits:
+		low = bits & -bits
+		yield low.bit_length() - 1
+		bits ^= low
+
+def solve(name, flow, gen, kill, boundary=0, forward=True, universe=None):
+	'''Solve a dataflow problem called `name` (used for statistics) over
+	the CFG `flow`. `gen` and `kill` map block IDs to bitsets; missing
+	blocks generate and kill nothing. The facts flowing into a block are
+	the union of those flowing out of its predecessors (or successors, for
+	backward problems); if a `universe` bitset is given, the intersection is
+	used instead. Blocks without predecessors (successors) start out with
+	the `boundary` facts.
+	
+	Returns two dicts mapping block IDs to the facts holding before and
+	after each block, in the direction of execution.'''
+	
+	ids = order(flow)
+	adj, off = flow.pred, flow.poff
+	outs, outoff = flow.succ, flow.soff
+	if not forward:
+		ids.reverse()
+		adj, off, outs, outoff = outs, outoff, adj, off
+	
+	size = len(flow.blocks.list)
+	init = 0 if universe is None else universe
+	gens, kills = [0] * size, [0] * size
+	for id in ids:
+		gens[id], kills[id] = gen.get(id, 0), kill.get(id, 0)
+	
+	into, out = [0] * size, [init] * size
+	pending = bytearray(size)
+	for id in ids:
+		pending[id] = 1
+	
+	rounds, visits, left = 0, 0, len(ids)
+	while left:
+		
+		rounds += 1
+		for id in ids:
+			
+			if not pending[id]:
+				continue
+			
+			pending[id] = 0
+			left -= 1
+			visits += 1
+			lo, hi = off[id], off[id + 1]
+			if lo == hi:
+				bits = boundary
+			elif universe is None:
+				bits = 0
+				for src in adj[lo:hi]:
+					bits |= out[src]
+			else:
+				bits = universe
+				for src in adj[lo:hi]:
+					bits &= out[src]
+			
+			into[id] = bits
+			bits = gens[id] | (bits & ~kills[id])
+			if bits != out[id]:
+				out[id] = bits
+				for dst in outs[outoff[id]:outoff[id + 1]]:
+					if not pending[dst]:
+						pending[dst] = 1
+						left += 1
+	
+	stats.count(name, runs=1, blocks=len(ids), rounds=rounds, visits=visits)
+	into = {id: into[id] for id in ids}
+	out = {id: out[id] for id in ids}
+	return (into, out) if forward else (out, into)
@@ -12,31 +12,34 @@ This pass inserts ``Free`` nodes into the CFG,
 which are then expanded into function calls during the code generation phase.
 '''
 
-from . import ast, blocks, types, util
+from . import ast, blocks, dataflow, types, util
 
 class Free(util.AttribRepr):
+	__slots__ = 'value',
 	fields = 'value',
 	def __init__(self, value):
 		self.value = value
 
+def exits(flow):
+	'''For each block that returns, find the set of transitive predecessor
+	blocks; assignments in these blocks will need freeing. This is solved
+	as a backward dataflow problem, where each returning block is a fact.'''
+	
+	ids = sorted(id for (id, bl) in util.items(flow.blocks) if bl.returns)
+	gen = {id: 1 << i for (i, id) in enumerate(ids)}
+	before, after = dataflow.solve('returns', flow, gen, {}, forward=False)
+	
+	res = {id: set() for id in ids}
+	for id, bits in util.items(before):
+		for i in dataflow.members(bits):
+			res[ids[i]].add(id)
+	return res
+
 def destructify(mod, code):
 	
-	returns, reassign, left = {}, [], {}
+	returns, reassign, left = exits(code.flow), [], {}
 	for i, bl in util.items(code.flow.blocks):
 		
-		# For each block that returns, find the set of transitive
-		# predecessor blocks; these assignments will need freeing.
-		
-		if bl.returns:
-			returns[i], q = set(), {i}
-			while q:
-				cur = q.pop()
-				returns[i].add(cur)
-				for p in code.flow.blocks[cur].preds:
-					if p.id in returns[i] or p.id in q:
-						continue
-					q.add(p.id)
-		
 		# Find assignments to owner variables; the last assignment
 		# will be freed before return, earlier ones before next assign.
 		
@@ -79,6 +82,8 @@ def destructify(mod, code):
 	if code.irname == 'main' and code.args:
 		left['args'] = mod.types.get('$array[str]'), {None}
 	
+	# Insert from the end of each block, so earlier indexes stay valid
+	reassign.sort(key=lambda r: r[1:3], reverse=True)
 	for name, bid, sid, type in reassign:
 		node = ast.Name(name, None)
 		node.type = type
@@ -0,0 +1,417 @@
+'''The fold pass evaluates constant expressions at compile time, before any
+analysis runs on the CFG, so that later passes and the generated code have
+fewer steps and blocks to deal with.
+
+Values are tracked for integers, floats and booleans. Integer literals are
+untyped (``anyint``) until the specialize pass, so the result of an operation
+on untyped literals is only folded if it is non-negative and fits in 32 bits
+(and division and modulo only for non-negative operands, since they are
+signed in the generated code). Integers cast to a basic integer type with
+``as`` have a known width and signedness, so operations on them wrap around
+like they do at run time.
+
+- Arithmetic, bitwise, comparison and boolean operations on constants are
+  replaced with their result; so are ``as`` casts of constant integers to
+  integer types, which stay in the form ``<literal> as <type>``.
+- Uses of a variable are replaced with its value if all the assignments
+  reaching the use assign the same constant (see ``values()``). Module-level
+  integer constants are substituted the same way in functions that don't
+  assign to the name.
+- Assignments to temporaries that are no longer used are removed.
+
+This is repeated until nothing changes, since folding a temporary can make
+the expressions using it constant.
+
+Branches on constant conditions are folded by the separate ``branches`` pass,
+which runs after the type checker, so that type errors in code that can never
+run are still reported: a ``CondBranch`` on a constant condition becomes a
+``Branch``, the blocks that became unreachable are removed (see the simplify
+module) and the liveness data is updated.
+'''
+
+from . import ast, blocks, dataflow, liveness, simplify, types, util
+import math, operator
+
+# Operations on the values of constants, by node type
+
+ARITH = {
+	ast.Add: operator.add,
+	ast.Sub: operator.sub,
+	ast.Mul: operator.mul,
+	ast.Div: operator.floordiv,
+	ast.Mod: operator.mod,
+	ast.BWAnd: operator.and_,
+	ast.BWOr: operator.or_,
+	ast.BWXor: operator.xor,
+}
+
+COMPARE = {
+	ast.EQ: operator.eq,
+	ast.NE: operator.ne,
+	ast.LT: operator.lt,
+	ast.GT: operator.gt,
+}
+
+BOOLEAN = {
+	ast.And: lambda a, b: a and b,
+	ast.Or: lambda a, b: a or b,
+}
+
+BINARY = tuple(ARITH) + tuple(COMPARE) + tuple(BOOLEAN)
+UNTYPED = 32 # bits for the result of operations on untyped integers
+
+class Undefined(object):
+	'''The value of a variable on entry to the function'''
+	def __repr__(self):
+		return 'UNDEFINED'
+
+UNDEFINED = Undefined()
+
+def bits(tname):
+	'''Returns the signedness and width of integer type `tname`'''
+	if tname is None:
+		return True, UNTYPED
+	return types.INTEGERS[tname]
+
+def fits(val, tname):
+	'''Returns True if `val` can be used as a value of integer type `tname`
+	(or as an untyped integer, if `tname` is None)'''
+	if tname is None:
+		return 0 <= val < 1 << (UNTYPED - 1)
+	signed, width = types.INTEGERS[tname]
+	if signed:
+		return -(1 << (width - 1)) <= val < 1 << (width - 1)
+	return 0 <= val < 1 << width
+
+def wrap(val, tname):
+	'''Wraps `val` around to the range of integer type `tname`'''
+	signed, width = types.INTEGERS[tname]
+	val &= (1 << width) - 1
+	if signed and val >= 1 << (width - 1):
+		val -= 1 << width
+	return val
+
+def cast(key, type):
+	'''Returns the value of a constant cast to the `type` node, or None'''
+	if key is None or key[0] != 'int' or not isinstance(type, ast.Name):
+		return None
+	if type.name not in types.INTEGERS or not fits(key[1], type.name):
+		return None
+	return 'int', key[1], type.name
+
+def literal(node):
+	'''Returns the value of a literal node as a tuple of kind (``'int'``,
+	``'float'`` or ``'bool'``), value and integer type name, or None'''
+	if isinstance(node, ast.Bool):
+		return 'bool', node.val, None
+	elif isinstance(node, ast.Int):
+		return 'int', int(node.val), None
+	elif isinstance(node, ast.Float):
+		return 'float', float(node.val), None
+	elif isinstance(node, ast.As) and isinstance(node.left, ast.Int):
+		return cast(literal(node.left), node.right)
+	return None
+
+def build(key, pos):
+	'''Returns a new literal node for the constant `key`'''
+	kind, val, tname = key
+	if kind == 'bool':
+		return ast.Bool('True' if val else 'False', pos)
+	elif kind == 'float':
+		return ast.Float(repr(val), pos)
+	
+	node = ast.Int(str(val), pos)
+	if tname is None:
+		return node
+	
+	res = ast.As(pos)
+	res.left, res.right = node, ast.Name(tname, pos)
+	return res
+
+def integers(op, left, right):
+	'''Combine two integer constants with operation node type `op`'''
+	
+	if left[2] is not None and right[2] is not None and left[2] != right[2]:
+		return None
+	
+	# like the type checker, an untyped operand takes the other one's type
+	a, b, tname = left[1], right[1], left[2] or right[2]
+	if not fits(a, tname) or not fits(b, tname):
+		return None
+	elif op in COMPARE:
+		return 'bool', COMPARE[op](a, b), None
+	elif op not in ARITH:
+		return None
+	
+	if op in (ast.Div, ast.Mod):
+		limit = 1 << (bits(tname)[1] - 1)
+		if not 0 <= a < limit or not 0 < b < limit:
+			return None
+	
+	val = ARITH[op](a, b)
+	if tname is not None:
+		return 'int', wrap(val, tname), tname
+	return ('int', val, None) if fits(val, None) else None
+
+def floats(op, left, right):
+	'''Combine two float constants with operation node type `op`'''
+	
+	a, b = left[1], right[1]
+	if op in COMPARE:
+		return 'bool', COMPARE[op](a, b), None
+	elif op not in (ast.Add, ast.Sub, ast.Mul, ast.Div):
+		return None
+	elif op is ast.Div and not b:
+		return None
+	
+	val = operator.truediv(a, b) if op is ast.Div else ARITH[op](a, b)
+	if math.isinf(val) or math.isnan(val) or 'e' in repr(val):
+		return None
+	return 'float', val, None
+
+def evaluate(node):
+	'''Returns the value of `node` if its operands are literals, or None'''
+	
+	if isinstance(node, (ast.Bool, ast.Int, ast.Float)):
+		return literal(node)
+	elif isinstance(node, ast.As):
+		return cast(evaluate(node.left), node.right)
+	elif isinstance(node, ast.Not):
+		val = truth(literal(node.value))
+		return None if val is None else ('bool', not val, None)
+	elif not isinstance(node, BINARY):
+		return None
+	
+	left, right = literal(node.left), literal(node.right)
+	if left is None or right is None or left[0] != right[0]:
+		return None
+	elif left[0] == 'int':
+		return integers(node.__class__, left, right)
+	elif left[0] == 'float':
+		return floats(node.__class__, left, right)
+	elif node.__class__ in BOOLEAN:
+		return 'bool', BOOLEAN[node.__class__](left[1], right[1]), None
+	elif node.__class__ in (ast.EQ, ast.NE):
+		return 'bool', COMPARE[node.__class__](left[1], right[1]), None
+	return None
+
+def writes(step):
+	'''Yields (name, value) tuples for the variables assigned by `step`, with
+	None as the value if it is not a constant'''
+	
+	if isinstance(step, ast.Assign) and isinstance(step.left, ast.Name):
+		yield step.left.name, literal(step.right)
+	elif isinstance(step, ast.Assign) and isinstance(step.left, ast.Tuple):
+		for n in step.left.values:
+			if isinstance(n, ast.Name):
+				yield n.name, None
+	elif isinstance(step, ast.IAdd) and isinstance(step.left, ast.Name):
+		yield step.left.name, None
+	elif isinstance(step, blocks.LoopHeader):
+		yield step.lvar.name, None
+
+def values(flow):
+	'''Computes the values of the variables assigned in `flow` on entry to
+	each block, with a reaching definitions analysis where a definition is
+	the last assignment to a variable in a block, along with the value it
+	assigns (or None), or UNDEFINED for the variable's value on entry to the
+	function.
+	
+	Returns the set of names assigned in `flow` and a function taking a
+	block ID and one of those names, which returns the value of the variable
+	if it is the same for all the definitions reaching the block, or None.'''
+	
+	defs, masks, last = [], {}, {}
+	def define(name, val):
+		bit = 1 << len(defs)
+		defs.append(val)
+		masks[name] = masks.get(name, 0) | bit
+		return bit
+	
+	for id, bl in util.items(flow.blocks):
+		last[id] = {}
+		for step in bl.steps:
+			last[id].update(writes(step))
+	
+	undefined = 0
+	for name in sorted(set(n for cur in util.values(last) for n in cur)):
+		undefined |= define(name, UNDEFINED)
+	
+	gen, kill = {}, {}
+	for id, cur in util.items(last):
+		gen[id] = kill[id] = 0
+		for name, val in sorted(util.items(cur)):
+			gen[id] |= define(name, val)
+		for name in cur:
+			kill[id] |= masks[name]
+	
+	ins, outs = dataflow.solve('fold', flow, gen, kill, undefined)
+	def value(id, name):
+		found = set(defs[n] for n in dataflow.members(ins[id] & masks[name]))
+		val = found.pop() if len(found) == 1 else None
+		return None if val is UNDEFINED else val
+	
+	return set(masks), value
+
+def dead(step, used):
+	'''Returns True if `step` assigns a constant to an unused temporary'''
+	if not isinstance(step, ast.Assign) or not isinstance(step.left, ast.Name):
+		return False
+	name = step.left.name
+	return name[0] == '$' and name not in used and literal(step.right) is not None
+
+def truth(val):
+	'''Returns the truth value of a constant used as a condition, or None
+	if it has no __bool__() method to call'''
+	if val is None or val[0] == 'float' or val[2] is not None:
+		return None
+	return bool(val[1])
+
+class Folder(object):
+
+	def __init__(self, mod, code):
+		self.mod = mod
+		self.code = code
+		self.args = {arg.name.name for arg in code.args}
+		self.assigned, self.value = set(), None
+		self.id, self.local = None, None
+		self.changed = False
+	
+	def constant(self, name):
+		'''Returns the value of variable `name` at the current step'''
+		
+		if name in self.local:
+			return self.local[name]
+		elif name in self.assigned:
+			return self.value(self.id, name)
+		elif name in self.args:
+			return None
+		
+		const = self.mod.names.get(name)
+		if isinstance(const, blocks.Constant) and isinstance(const.node, ast.Int):
+			return cast(literal(const.node), ast.Name('int', None))
+		return None
+	
+	def rewrite(self, node):
+		'''Returns `node`, or a replacement for it if it is a variable with
+		a constant value or an expression that can be folded'''
+		
+		if isinstance(node, ast.Name):
+			val = self.constant(node.name)
+			if val is None:
+				return node
+			self.changed = True
+			return build(val, node.pos)
+		elif isinstance(node, ast.Call):
+			node.args = [self.rewrite(arg) for arg in node.args]
+			return node
+		elif isinstance(node, ast.As):
+			node.left = self.rewrite(node.left)
+		elif isinstance(node, ast.Not):
+			node.value = self.rewrite(node.value)
+		elif isinstance(node, BINARY):
+			node.left = self.rewrite(node.left)
+			node.right = self.rewrite(node.right)
+		else:
+			return node
+		
+		val = evaluate(node)
+		if val is None or literal(node) is not None:
+			return node
+		self.changed = True
+		return build(val, node.pos)
+	
+	def step(self, step):
+		'''Fold the expressions in `step`; returns its replacement'''
+		
+		if isinstance(step, (ast.Assign, ast.IAdd)):
+			step.right = self.rewrite(step.right)
+		elif isinstance(step, ast.Return) and step.value is not None:
+			step.value = self.rewrite(step.value)
+		elif isinstance(step, ast.Call):
+			step = self.rewrite(step)
+		elif isinstance(step, blocks.CondBranch):
+			step.cond = self.rewrite(step.cond)
+		return step
+	
+	def fold(self):
+		'''Does a single round of folding. Returns True if anything changed.'''
+		self.assigned, self.value = values(self.code.flow)
+		self.changed = False
+		for id, bl in util.items(self.code.flow.blocks):
+			self.id, self.local = id, {}
+			for i, step in enumerate(bl.steps):
+				bl.steps[i] = self.step(step)
+				self.local.update(writes(bl.steps[i]))
+		return self.changed
+	
+	def prune(self):
+		'''Remove assignments of constants to temporaries that are not
+		used anymore'''
+		
+		analyzer, used = liveness.Analyzer(), set()
+		for bl in util.values(self.code.flow.blocks):
+			for step in bl.steps:
+				analyzer.vars = used, set()
+				analyzer.visit(step)
+		
+		for bl in util.values(self.code.flow.blocks):
+			bl.steps = [s for s in bl.steps if not dead(s, used)]
+
+def constants(mod, code):
+	folder = Folder(mod, code)
+	while folder.fold():
+		pass
+	folder.prune()
+
+def branch(code):
+	'''Replace each ``CondBranch`` on a constant condition in `code` with a
+	``Branch`` and remove the blocks that are no longer reachable, then
+	update the liveness data. Nothing is changed if that would remove one
+	side of a ``Phi`` with a different type than the other side.'''
+	
+	flow, edges, folded = code.flow, code.flow.edges, []
+	for id, bl in util.items(flow.blocks):
+		
+		step = bl.steps[-1] if bl.steps else None
+		if not isinstance(step, blocks.CondBranch):
+			continue
+		
+		cond = truth(literal(step.cond))
+		if cond is None:
+			continue
+		
+		keep, drop = (step.tg1, step.tg2) if cond else (step.tg2, step.tg1)
+		folded.append((bl, keep, drop))
+		if keep != drop:
+			edges[id].remove(drop)
+	
+	if not folded:
+		return
+	
+	live = simplify.reachable(edges)
+	for id in live:
+		for step in flow.blocks[id].steps:
+			phi = simplify.phis(step)
+			if phi is None or (phi.left[0] in live) == (phi.right[0] in live):
+				continue
+			side = phi.left[1] if phi.left[0] in live else phi.right[1]
+			if side.type != phi.type:
+				return
+	
+	for bl, keep, drop in folded:
+		bl.steps[-1] = blocks.Branch(keep)
+		if keep != drop:
+			flow.checks.pop((bl.id, drop), None)
+	
+	flow.link(edges)
+	simplify.cleanup(code)
+	liveness.analyze(code)
+
+def fold(mod):
+	for name, code in mod.code:
+		constants(mod, code)
+
+def branches(mod):
+	for name, code in mod.code:
+		branch(code)
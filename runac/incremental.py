@@ -0,0 +1,310 @@
+'''Function-granular incremental compilation.
+
+Once the module scope has been set up by the type inferencing pass, all of
+the work of compiling a module is done one code object (function or method)
+at a time: the simplify, fold, liveness, typer, branches, specialize,
+escapes and destruct passes and code generation all look at a single
+function. This module caches the LLVM IR generated for each code object,
+so that only functions whose inputs have changed since the last compilation
+go through the passes again.
+
+The cache key for a code object is a hash of:
+
+- the compiler version (see ``cache.version()``), the target triple and
+  the name of the module, if it is imported by the program,
+- its syntax tree, ignoring source positions,
+- the signatures of module-level functions, declarations, constants and
+  imports that it refers to by name, and
+- the declarations of all classes and traits (without method bodies), since
+  types can be used without being named, for example through the return
+  type of a called function.
+
+Next to the IR for the function, an entry stores the declarations for the
+variant types (like instantiated templates) that the function needed, so
+that they are still emitted when all of their users come from the cache.
+Generators and loops over them are always processed, since the context type
+of a generator is shared between it and all of its callers.
+
+Code objects that could be cached can also be compiled in parallel: when
+there are enough of them, they are divided among a pool of worker processes
+(see ``runac.JOBS``), forked after the module scope has been set up and the
+other code objects have been processed. Each worker returns what would be
+stored in the cache, so the output is the same as for a serial run.
+'''
+
+from . import ast, blocks, cache, codegen, stats, util
+from . import simplify, fold, liveness, typer, specialize, escapes, destructor
+import multiprocessing, os, pickle
+
+# Number of code objects each worker process should get at least before
+# the passes are run in parallel, since starting the pool has a cost
+BATCH = 32
+
+def walk(obj, out, names):
+	'''Append a serialization of `obj` to the list `out`, leaving out
+	source positions. Names referenced are added to the set `names`.
+	Returns False if the code contains loops, which are never cached
+	(see above).'''
+	
+	cacheable = True
+	if isinstance(obj, ast.Name):
+		names.add(obj.name)
+	elif isinstance(obj, blocks.LoopSetup):
+		cacheable = False
+	
+	if isinstance(obj, blocks.Block):
+		out.append('Block(%s, %r, %s, %s, [%s], ' % (
+			obj.id, obj.anno, obj.returns, obj.raises,
+			', '.join(str(p.id) for p in obj.preds),
+		))
+		cacheable = walk(obj.steps, out, names) and cacheable
+		out.append(')')
+	elif isinstance(obj, (list, tuple)):
+		out.append('(')
+		for e in obj:
+			cacheable = walk(e, out, names) and cacheable
+		out.append(')')
+	elif isinstance(obj, (set, frozenset)):
+		out.append('{%s}' % ', '.join(sorted(repr(e) for e in obj)))
+	elif isinstance(obj, dict):
+		out.append('{')
+		for k, v in sorted(util.items(obj)):
+			out.append('%r: ' % (k,))
+			cacheable = walk(v, out, names) and cacheable
+		out.append('}')
+	elif hasattr(obj, '__dict__') or hasattr(obj, '__slots__'):
+		out.append(obj.__class__.__name__ + '(')
+		for k, v in sorted(util.items(util.attribs(obj))):
+			if k in util.IGNORE:
+				continue
+			out.append(k + '=')
+			cacheable = walk(v, out, names) and cacheable
+		out.append(')')
+	else:
+		out.append(repr(obj))
+	
+	return cacheable
+
+def fingerprint(obj):
+	out = []
+	walk(obj, out, set())
+	return ''.join(out)
+
+def interface(mod):
+	'''Returns a digest of the classes and traits in the module, including
+	the signatures (but not the bodies) of their methods.'''
+	
+	parts = []
+	for name, obj in sorted(util.items(mod.names)):
+		if not isinstance(obj, (ast.Class, ast.Trait)):
+			continue
+		methods = [(m.decor, m.name, m.args, m.rtype) for m in obj.methods]
+		attribs = getattr(obj, 'attribs', None)
+		parts.append(fingerprint((obj.decor, obj.name, obj.params, attribs)))
+		parts.append(fingerprint(methods))
+	
+	return cache.digest(*parts)
+
+def keys(mod):
+	'''Returns a list with a cache key (or None, if the code object cannot
+	be cached) for each code object in the module'''
+	
+	functions = {}
+	for name, fun in mod.code:
+		if isinstance(name, str):
+			functions[name] = fun
+	
+	triple = codegen.target()[1]
+	base = cache.digest(cache.version(), triple, mod.name or '', interface(mod))
+	res = []
+	for name, fun in mod.code:
+		
+		out, names = [], set()
+		if not walk(fun, out, names) or fun.flow.yields:
+			res.append(None)
+			continue
+		
+		deps = []
+		for ref in sorted(names):
+			if ref in functions:
+				sig = functions[ref].args, functions[ref].rtype
+			else:
+				sig = mod.names.get(ref)
+			if isinstance(sig, blocks.Constant):
+				sig = sig.node
+			if not isinstance(sig, (ast.Class, ast.Trait)):
+				deps += [ref, fingerprint(sig)]
+		
+		res.append(cache.digest(base, repr(name), ''.join(out), *deps))
+	
+	return res
+
+def process(mod, name, fun):
+	'''Run all the passes over a single code object'''
+	with stats.Phase('simplify', name, fun):
+		simplify.cleanup(fun)
+	with stats.Phase('fold', name, fun):
+		fold.constants(mod, fun)
+	with stats.Phase('liveness', name, fun):
+		liveness.analyze(fun)
+	with stats.Phase('typer', name, fun):
+		typer.check(mod, name, fun)
+	with stats.Phase('branches', name, fun):
+		fold.branch(fun)
+	with stats.Phase('specialize', name, fun):
+		specialize.Specializer(mod, fun).propagate()
+	with stats.Phase('escapes', name, fun):
+		escapes.EscapeFinder(mod, fun).find()
+	with stats.Phase('destruct', name, fun):
+		destructor.destructify(mod, fun)
+
+def independent(fun):
+	'''Returns True if the code object `fun` can go through the passes
+	before the others, that is if it is not a generator and does not loop
+	over one (see above)'''
+	if fun.flow.yields:
+		return False
+	for bl in util.values(fun.flow.blocks):
+		for step in bl.steps:
+			if isinstance(getattr(step, 'right', None), blocks.LoopSetup):
+				return False
+	return True
+
+def forking():
+	'''Returns the multiprocessing context (or module) to start a pool of
+	processes forked from this one, or None if the platform cannot fork'''
+	if not hasattr(os, 'fork'):
+		return None
+	if hasattr(multiprocessing, 'get_context'): # Python 3
+		return multiprocessing.get_context('fork')
+	return multiprocessing
+
+SHARED = None # the Module being compiled, as inherited by the workers
+WORKER = None # the worker's CodeGen and the frame from its header
+
+def work(i):
+	'''Run the passes and code generation over code object `i` of the
+	shared Module, in a worker process. Returns the IR and the declarations
+	of the variant types it uses, like a cache entry, or None if the passes
+	raised an error (which refers to types that cannot be pickled).'''
+	
+	global WORKER
+	mod = SHARED
+	if WORKER is None:
+		mod.variants = set()
+		gen = codegen.CodeGen(mod, codegen.target()[0])
+		WORKER = gen, gen.header(mod)
+	
+	gen, frame = WORKER
+	name, fun = mod.code[i]
+	mod.variants = set()
+	try:
+		process(mod, name, fun)
+	except (util.Error, util.ParseError):
+		return None
+	
+	ir = gen.function(name, fun, frame)
+	return ir, {t.name: gen.typedecl(t) for t in mod.variants}
+
+def shard(mod, indexes, count):
+	'''Returns the results of work() for the code objects at `indexes`,
+	from a pool of `count` worker processes forked from this one'''
+	
+	global SHARED
+	SHARED = mod # before the workers are forked
+	pool = forking().Pool(count)
+	try:
+		size = max(1, len(indexes) // (count * 4))
+		with stats.Phase('workers'):
+			return pool.map(work, indexes, size)
+	finally:
+		SHARED = None
+		pool.terminate()
+		pool.join()
+
+def prepare(mod):
+	'''Run the passes over the module, reusing cached IR for unchanged code
+	objects if caching is enabled. Returns a CodeGen for the module and the
+	function it should call to add the IR for the others to the cache (or
+	None, if caching is disabled).'''
+	
+	import runac
+	fkeys = [None] * len(mod.code)
+	if cache.ENABLED:
+		with stats.Phase('keys'):
+			fkeys = keys(mod)
+	
+	with stats.Phase('typer'):
+		typer.prepare(mod)
+	
+	cached, todo = {}, []
+	for i, (name, fun) in enumerate(mod.code):
+		data = cache.read('function', fkeys[i]) if fkeys[i] else None
+		if data is not None:
+			cached[i] = pickle.loads(data)
+		else:
+			todo.append(i)
+	
+	hits, shared = len(cached), []
+	count = runac.workers(len(todo) // BATCH)
+	if count > 1 and forking() is not None:
+		shared = [i for i in todo if independent(mod.code[i][1])]
+		skip = set(shared)
+		todo = [i for i in todo if i not in skip]
+	
+	used, variants, error = {}, set(), None
+	for i in todo:
+		used[i] = mod.variants = set()
+		try:
+			process(mod, *mod.code[i])
+		except (util.Error, util.ParseError) as e:
+			error = i, e
+			break
+		variants |= used[i]
+	
+	if error is not None: # report the same error as a serial run
+		shared = [i for i in shared if i < error[0]]
+	for i, res in zip(shared, shard(mod, shared, count) if shared else ()):
+		if res is None: # raise the error again, in this process
+			process(mod, *mod.code[i])
+			name = stats.fname(mod.code[i][0])
+			raise RuntimeError('worker failed on %s, but it passes here' % name)
+		cached[i] = res
+		if fkeys[i] is not None:
+			data = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
+			cache.write('function', fkeys[i], data)
+	
+	if error is not None:
+		raise error[1]
+	
+	mod.variants = variants
+	gen = codegen.CodeGen(mod, codegen.target()[0], cached)
+	if not cache.ENABLED:
+		return gen, None
+	
+	def store(i, ir):
+		if fkeys[i] is None:
+			return
+		decls = {t.name: gen.decls[t.name] for t in used[i]}
+		data = pickle.dumps((ir, decls), pickle.HIGHEST_PROTOCOL)
+		cache.write('function', fkeys[i], data)
+	
+	util.note('functions: %i of %i from cache' % (hits, len(mod.code)))
+	return gen, store
+
+def stream(mod):
+	'''Run the passes over the module and return an iterator over chunks
+	of LLVM IR for it (see ``codegen.CodeGen.stream()``). IR for the code
+	objects is taken from or added to the cache (see prepare()).'''
+	gen, store = prepare(mod)
+	return gen.stream(store)
+
+def split(mod, count):
+	'''Like stream(), but returns a list of up to `count` compilation units
+	(see ``codegen.CodeGen.split()``)'''
+	gen, store = prepare(mod)
+	return gen.split(count, store)
+
+def generate(mod):
+	'''Like ``stream()``, but returns the IR as a single string'''
+	return ''.join(stream(mod))
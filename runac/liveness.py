@@ -10,9 +10,12 @@ While we can simply store pointers on the stack in many cases
 during code generation in order to leave analysis to LLVM,
 all the analyses we have to do
 still need somewhat accurate data on variable usage.
+The assignments that may reach each use are found
+with a reaching definitions analysis
+built on the dataflow module (see ``reaching()``).
 '''
 
-from . import ast, util
+from . import ast, dataflow, util
 
 class Analyzer(object):
 	
@@ -75,58 +78,97 @@ class Analyzer(object):
 		self.visit(node.left[1])
 		self.visit(node.right[1])
 
-def defined(name, bl, seen):
+def reaching(flow):
+	'''Computes reaching definitions for the blocks in `flow`, which must
+	have ``assigns`` filled in. A definition is a (name, block ID) tuple for
+	each block assigning to the variable, or (name, None) for the variable
+	being undefined on entry (to a block without predecessors). Sets of
+	definitions are bitsets indexed by position in the list of definitions
+	(see the dataflow module).
 	
-	if name in bl.assigns:
-		return {bl.id}
-	elif not bl.preds:
-		return {None}
+	Returns the list of definitions, a dict mapping variable names to the
+	bitset of their definitions and a dict mapping block IDs to the
+	definitions reaching the start of that block.'''
 	
-	all = set()
-	for p in bl.preds:
-		if p.id not in seen:
-			all.update(defined(name, p, seen | {bl.id}))
+	defs, masks = [], {}
+	def define(name, id):
+		bit = 1 << len(defs)
+		defs.append((name, id))
+		masks[name] = masks.get(name, 0) | bit
+		return bit
 	
-	return all
+	blocks, names = sorted(util.items(flow.blocks)), set()
+	for id, bl in blocks:
+		names.update(bl.uses)
+		names.update(bl.assigns)
+	
+	undefined = 0
+	for name in sorted(names):
+		undefined |= define(name, None)
+	
+	gen, kill = {}, {}
+	for id, bl in blocks:
+		gen[id] = 0
+		for name in sorted(bl.assigns):
+			gen[id] |= define(name, id)
+	
+	for id, bl in blocks:
+		kill[id] = 0
+		for name in bl.assigns:
+			kill[id] |= masks[name]
+	
+	ins, outs = dataflow.solve('reaching', flow, gen, kill, undefined)
+	return defs, masks, ins
 
-def liveness(mod):
+def analyze(code):
 	
 	analyzer = Analyzer()
-	for fname, code in mod.code:
+	
+	refs, blocks = {}, sorted(util.items(code.flow.blocks))
+	for id, bl in blocks:
 		
-		refs, blocks = {}, sorted(util.items(code.flow.blocks))
-		for id, bl in blocks:
+		bl.uses = {}
+		bl.assigns = {}
+		
+		for i, step in enumerate(bl.steps):
+			
+			analyzer.vars = set(), set()
+			analyzer.visit(step)
 			
-			bl.uses = {}
-			bl.assigns = {}
+			for name in analyzer.vars[0]:
+				bl.uses.setdefault(name, set()).add(i)
+				refs.setdefault(id, []).append((i, name))
 			
-			for i, step in enumerate(bl.steps):
-				
-				analyzer.vars = set(), set()
-				analyzer.visit(step)
-				
-				for name in analyzer.vars[0]:
-					bl.uses.setdefault(name, set()).add(i)
-					refs.setdefault(id, []).append((i, name))
-				
-				for name in analyzer.vars[1]:
-					bl.assigns.setdefault(name, set()).add(i)
-					refs.setdefault(id, []).append((i, name))
+			for name in analyzer.vars[1]:
+				bl.assigns.setdefault(name, set()).add(i)
+				refs.setdefault(id, []).append((i, name))
+	
+	# origins are frozensets, shared between all uses with the same
+	# reaching definitions (there are many of those in long if/elif chains)
+	
+	defs, masks, ins = reaching(code.flow)
+	shared = {}
+	for id, bl in blocks:
 		
-		for id, bl in blocks:
+		bl.origin = {}
+		for sid, name in refs.get(id, []):
+			
+			assigned = bl.assigns.get(name)
+			if assigned and min(assigned) < sid:
+				bits = -1 - id # not a bitset, but a key for the local block
+			else:
+				bits = ins[id] & masks[name]
+			
+			origin = shared.get(bits)
+			if origin is None:
+				if bits < 0:
+					origin = frozenset((id,))
+				else:
+					origin = frozenset(defs[n][1] for n in dataflow.members(bits))
+				shared[bits] = origin
 			
-			bl.origin = {}
-			for sid, name in refs.get(id, []):
-				
-				origin = bl.origin[name, sid] = set()
-				assigned = bl.assigns.get(name, set())
-				if assigned and min(assigned) < sid:
-					origin.add(id)
-					continue
-				elif not bl.preds:
-					if not (assigned and min(assigned) < sid):
-						origin.add(None)
-					continue
-				
-				for p in bl.preds:
-					origin.update(defined(name, p, set()))
+			bl.origin[name, sid] = origin
+
+def liveness(mod):
+	for fname, code in mod.code:
+		analyze(code)
@@ -1,5 +1,5 @@
-from . import ast, util
-import rply, sys, os
+from . import ast, util, cache
+import rply, re, sys, os
 
 NAME_LIKE = {
 	'break', 'class', 'continue', 'def', 'elif', 'else', 'except', 'for',
@@ -49,22 +49,19 @@ def lexer():
 	lg.ignore(r' +')
 	return lg.build()
 
-LEXER = lexer()
-
-def lex(src):
-	'''Takes a string containing source code and returns a generator over
-	tokens, represented by a three-element tuple:
-	
-	- Token type (from the list in lexer(), above)
-	- The literal token contents
-	- Position, as a tuple of line and column (both 1-based)
+LEXER = None
+
+def reference(src):
+	'''The original lexer, built on the rply lexer generated by lexer(),
+	above. It is kept as a reference for lex(), which should return the
+	same tokens: rply tries each of the rules above in order at every
+	position, then TABS tokens (which should only appear at the start of a
+	line) are reprocessed into INDENT and DEDENT tokens, keywords are
+	picked out of the NAME tokens and comments are dropped.'''
+	global LEXER
+	if LEXER is None:
+		LEXER = lexer()
 	
-	This is mostly a wrapper around the rply lexer, but it reprocesses
-	TABS tokens (which should only appear at the start of a line) into
-	INDENT and DEDENT tokens, which only appear if the indentation
-	level increases or decreases.
-	
-	Comment tokens do not appear in the output generator.'''
 	level = 0
 	hold = []
 	for t in LEXER.lex(src):
@@ -100,6 +97,127 @@ def lex(src):
 		yield rply.Token('DEDENT', '', t.source_pos)
 		level -= 1
 
+OPERATORS = {
+	'[': 'LBRA', ']': 'RBRA', '+': 'PLUS', '-': 'MINUS', '*': 'MUL',
+	'/': 'DIV', '{': 'LACC', '}': 'RACC', '<': 'LT', '>': 'GT', '.': 'DOT',
+	'&': 'AMP', '$': 'DOLLAR', '|': 'PIPE', '^': 'CARET', '%': 'MOD',
+	'(': 'LPAR', ')': 'RPAR', '=': 'ASGT', ',': 'COMMA', ':': 'COLON',
+	'?': 'QM',
+}
+
+DOUBLES = {
+	'->': 'ARROW', '+=': 'IADD', '==': 'EQ', '!=': 'NE', '>=': 'GE',
+	'<=': 'LE',
+}
+LETTERS = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+DIGITS = set('0123456789')
+NAME = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+NUM = re.compile(r'[-+?[0-9]*\.?[0-9]+')
+
+def lex(src):
+	'''Takes a string containing source code and returns a generator over
+	tokens, represented by rply Token objects with:
+	
+	- Token type (from the list in lexer(), above)
+	- The literal token contents
+	- Position, with the index and the line and column (both 1-based)
+	
+	This is a single-pass scanner, dispatching on the first character of
+	each token; it returns the same tokens as reference(). TABS tokens at
+	the start of a line are turned into INDENT and DEDENT tokens, which only
+	appear if the indentation level increases or decreases.
+	
+	Comment tokens do not appear in the output generator.'''
+	
+	Token, Position = rply.Token, rply.token.SourcePosition
+	i, size, line, start = 0, len(src), 1, 0
+	level, hold, last = 0, [], None
+	while i < size:
+		
+		c = src[i]
+		if c == ' ':
+			i += 1
+			while i < size and src[i] == ' ':
+				i += 1
+			continue
+		
+		if c in OPERATORS or c == '!':
+			if src[i:i + 2] in DOUBLES:
+				name, end = DOUBLES[src[i:i + 2]], i + 2
+			elif c in OPERATORS:
+				name, end = OPERATORS[c], i + 1
+			else:
+				raise rply.LexingError(None, Position(i, line, i - start + 1))
+		elif c in LETTERS:
+			if src.startswith('True', i):
+				name, end = 'BOOL', i + 4
+			elif src.startswith('False', i):
+				name, end = 'BOOL', i + 5
+			elif src.startswith('None', i):
+				name, end = 'NONE', i + 4
+			else:
+				name, end = 'NAME', NAME.match(src, i).end()
+		elif c in DIGITS:
+			name, end = 'NUM', NUM.match(src, i).end()
+		elif c == '\n':
+			name, end = 'NL', i + 1
+		elif c == '\t':
+			end = i + 1
+			while end < size and src[end] == '\t':
+				end += 1
+			name = 'TABS'
+		elif c == '#':
+			end = src.find('\n', i)
+			name, end = 'COM', size if end < 0 else end
+		elif c == "'" or c == '"':
+			end = src.find(c, i + 1)
+			if end < 0 or src.find('\n', i, end) >= 0:
+				raise rply.LexingError(None, Position(i, line, i - start + 1))
+			name, end = 'STR', end + 1
+		else:
+			raise rply.LexingError(None, Position(i, line, i - start + 1))
+		
+		last = t = Token(name, src[i:end], Position(i, line, i - start + 1))
+		i = end
+		if name == 'NL':
+			line, start = line + 1, end
+			if hold:
+				hold = [t]
+			else:
+				hold.append(t)
+			continue
+		elif name == 'TABS' and hold:
+			hold.append(t)
+			continue
+		
+		if hold:
+			yield hold[0]
+			cur = len(hold[1].value) if len(hold) > 1 else 0
+			pos = hold[1 if len(hold) > 1 else 0].source_pos
+			if cur > level:
+				# only the first is an INDENT, matching reference()
+				yield Token('INDENT', '', pos)
+				for j in range(cur - level - 1):
+					yield Token('DEDENT', '', pos)
+			else:
+				for j in range(level - cur):
+					yield Token('DEDENT', '', pos)
+			level, hold = cur, []
+		
+		if name == 'NAME' and t.value in NAME_LIKE:
+			t.name = t.value.upper()
+		elif name == 'COM':
+			continue
+		
+		yield t
+	
+	for t in hold:
+		yield t
+	
+	while level > 0:
+		yield Token('DEDENT', '', last.source_pos)
+		level -= 1
+
 pg = rply.ParserGenerator([
 		'AMP', 'AND', 'ARROW', 'AS', 'ASGT',
 		'BOOL', 'BREAK',
@@ -135,7 +253,7 @@ pg = rply.ParserGenerator([
 		('left', ['AS']),
 		('right', ['LBRA']),
 		('left', ['DOT']),
-	]
+	], cache_id='runac'
 )
 
 @pg.production('module : module-elems')
@@ -737,7 +855,20 @@ def none(s, p):
 def error(s, t):
 	raise util.ParseError(s.fn, t, s.pos(t))
 
-parser = pg.build()
+PARSER = None
+
+def build():
+	'''Build the LALR parser from the grammar above. This is deferred until
+	it is first needed, so that commands which only lex don't pay for it.
+	Tables are cached by rply (in its own user cache directory), using a
+	file name derived from a hash of the grammar productions and precedence
+	rules, so any change to the grammar causes the tables to be rebuilt.'''
+	global PARSER
+	if PARSER is None:
+		if not cache.ENABLED:
+			pg.cache_id = None
+		PARSER = pg.build()
+	return PARSER
 
 class State(object):
 
@@ -745,31 +876,22 @@ class State(object):
 		self.fn = fn
 		with open(fn) as f:
 			self.src = f.read()
-		self.lines = self.src.splitlines()
+		self.source = util.Source(fn, self.src)
 		pkg_name = '' if not pkg_name else pkg_name + '.'
 		self.mod_name = pkg_name + os.path.splitext(os.path.split(fn)[-1])[0]
 	
 	def pos(self, t):
 		'''Reprocess location information (see parse() for more details).'''
-		ln = t.source_pos.lineno - 1
-		if t.value and t.value[0] == '\n':
-			ln -= 1
-
-		col = t.source_pos.colno - 1
-		line = self.lines[ln] if ln < len(self.lines) else ''
-		return (ln, col), (ln, col + len(t.value)), line, self.fn
+		start = t.source_pos.idx
+		return util.Pos(self.source, start, start + len(t.value))
 
 def parse(pkg_name, fn):
 	'''Takes a file name and returns the AST corresponding to the source
 	contained in the file. The State thing is here mostly to reprocess
 	location information from rply into something easier to use. AST nodes
-	get a pos field containing a 4-element tuple:
-	
-	- Tuple of start location, as 0-based line and column numbers
-	- Tuple of end location, as 0-based line and column numbers
-	- The full line
-	- The file name
-	
-	This should be everything we need to build good error messages.'''
+	get a pos field containing a ``util.Pos``, which holds the start and end
+	offsets of the node in a ``util.Source`` shared by all nodes from the
+	same file. Line and column numbers are only computed from these when an
+	error message is shown.'''
 	state = State(pkg_name, fn)
-	return parser.parse(lex(state.src), state=state)
+	return build().parse(lex(state.src), state=state)
@@ -0,0 +1,195 @@
+'''Programs made of several modules.
+
+The file given to the compiler is the main module of the program. It can
+import functions, classes and traits from other modules written in Runa:
+``from pkg.util import f`` refers to ``pkg/util.rns``, relative to the
+directory containing the main module, and imported modules can import
+other modules in the same way. Imports that do not refer to a file (like
+``libc.string``) are resolved against the declarations in ``typer.ROOT``.
+
+Each module is compiled to its own object file, and the objects are linked
+into the binary (see ``runac.build()``). To compile a module, only an
+``Interface`` of the modules it imports is needed: the signatures of their
+functions and the declarations of their classes and traits, without any
+method bodies. Interfaces are cached, keyed on the source of the module,
+so an unchanged module does not have to be parsed again when one of its
+importers is compiled. The cache key for an object file includes the
+digests of the interfaces the module depends on, so changing the body of a
+function only recompiles the module defining it.
+
+Functions in imported modules get IR names prefixed with the module name,
+so that different modules can define functions with the same name. Types
+are global, though: all of the classes and traits from the modules a module
+depends on are added to it, and they must have different names. The core
+library is compiled as part of the main module; other modules declare the
+functions from it they need.
+'''
+
+from . import ast, cache, util
+import copy, os, pickle
+
+class Interface(object):
+	'''What importers need to know about a module: its `name` (None for
+	the main module), the file it came from, its imports (a dict mapping
+	module names to the first imported Name node, for error messages), its
+	functions (as ``ast.Decl`` nodes, named after their IR names) and its
+	classes and traits. `key` is the cache key for the interface, which is
+	derived from the module's source; `digest` is a hash of the interface
+	itself, ignoring source positions.'''
+	
+	def __init__(self, name, fn, key, mod):
+		
+		from . import incremental
+		self.name = name
+		self.fn = fn
+		self.key = key
+		self.imports = {k: v[0] for (k, v) in util.items(mod.imports)}
+		
+		self.functions = {}
+		for k, fun in mod.code:
+			if not isinstance(k, str):
+				continue
+			decl = ast.Decl(fun.pos)
+			decl.decor, decl.args, decl.rtype = fun.decor, fun.args, fun.rtype
+			decl.name = ast.Name(irname(name, k), fun.name.pos)
+			self.functions[k] = decl
+		
+		self.types = {}
+		for k, obj in util.items(mod.names):
+			if isinstance(obj, ast.Class):
+				obj = copy.copy(obj)
+				obj.methods = [stub(m) for m in obj.methods]
+				self.types[k] = obj
+			elif isinstance(obj, ast.Trait):
+				self.types[k] = obj
+		
+		parts = sorted(util.items(self.functions)) + sorted(util.items(self.types))
+		self.digest = cache.digest(incremental.fingerprint(parts))
+
+def irname(module, name):
+	'''Returns the IR name for the function `name` in `module`'''
+	return name if module is None else module + '.' + name
+
+def stub(fun):
+	'''Returns a copy of the method `fun` without its body'''
+	res = copy.copy(fun)
+	res.suite = None
+	if hasattr(res, 'flow'):
+		del res.flow
+	return res
+
+def path(root, name):
+	'''Returns the file name for the module called `name` in directory
+	`root`, or None if there is no such file'''
+	fn = os.path.join(root, *name.split('.')) + '.rns'
+	return fn if os.path.isfile(fn) else None
+
+def summary(name, fn, mods):
+	'''Returns the Interface for module `name` from file `fn`. If it is not
+	in the cache, the module is loaded and stored in `mods` for later use.'''
+	
+	import runac
+	with open(fn, 'rb') as f:
+		src = f.read()
+	
+	key = cache.digest(cache.version(), name or '', os.path.abspath(fn), src)
+	data = cache.read('interface', key)
+	if data is None:
+		mod = mods[name] = runac.load(fn)
+		data = pickle.dumps(Interface(name, fn, key, mod), pickle.HIGHEST_PROTOCOL)
+		cache.write('interface', key, data)
+	
+	# always use a copy: the passes change the nodes it shares with `mod`
+	return pickle.loads(data)
+
+def units(fn):
+	'''Returns a list of Interfaces for the modules making up the program
+	with main module `fn`, ordered so that each module comes after the
+	modules it imports; the main module comes last. Also returns a dict
+	of the Modules that had to be loaded along the way (see module()).'''
+	
+	root = os.path.dirname(os.path.abspath(fn))
+	res, mods, active = [], {}, []
+	def visit(name, fn, via):
+		
+		if any(unit.name == name for unit in res):
+			return
+		if name in active:
+			cycle = active[active.index(name):] + [name]
+			raise util.Error(via, 'import cycle: %s' % ' -> '.join(cycle))
+		
+		active.append(name)
+		unit = summary(name, fn, mods)
+		for base, node in sorted(util.items(unit.imports)):
+			dep = path(root, base)
+			if dep is not None:
+				visit(base, dep, node)
+		
+		active.pop()
+		res.append(unit)
+	
+	visit(None, fn, None)
+	return res, mods
+
+def closure(unit, units):
+	'''Returns the names of the modules `unit` imports, directly or
+	indirectly, in the same order as `units`'''
+	
+	seen, stack = set(), [unit]
+	while stack:
+		for base in stack.pop().imports:
+			if base not in seen and any(u.name == base for u in units):
+				seen.add(base)
+				stack += [u for u in units if u.name == base]
+	
+	return [u.name for u in units if u.name in seen]
+
+def key(unit, units, *options):
+	'''Returns the cache key for the object file for `unit`'''
+	import runac
+	from . import codegen
+	parts = [cache.version(), codegen.target()[1], runac.library()[0]]
+	parts += [unit.key, repr(options)]
+	deps = {u.name: u for u in units}
+	parts += [deps[name].digest for name in closure(unit, units)]
+	return cache.digest(*parts)
+
+def module(unit, units, mods):
+	'''Returns a Module for `unit`, with the names it imports from other
+	modules bound to their interfaces. Methods of imported classes are
+	added to the external code objects, so that they get declared.'''
+	
+	import runac
+	mod = mods.pop(unit.name, None) or runac.load(unit.fn)
+	mod.name = unit.name
+	if unit.name is not None:
+		for k, fun in mod.code:
+			if isinstance(k, str):
+				fun.irname = irname(unit.name, k)
+	
+	deps = {u.name: u for u in units}
+	mod.deps = closure(unit, units)
+	for name in mod.deps:
+		for k, obj in sorted(util.items(deps[name].types)):
+			
+			prev = mod.names.get(k, name + '.' + k)
+			if prev != name + '.' + k:
+				node = prev if isinstance(prev, ast.Node) else obj
+				msg = "type '%s' is also defined in module '%s'"
+				raise util.Error(node, msg % (k, name))
+			
+			mod.names[k] = obj
+			if isinstance(obj, ast.Class):
+				mod.external += [((k, m.name.name), m) for m in obj.methods]
+	
+	for base, names in sorted(util.items(mod.imports)):
+		if base not in deps:
+			continue
+		for node in names:
+			if node.name in deps[base].functions:
+				mod.names[node.name] = deps[base].functions[node.name]
+			elif node.name not in deps[base].types:
+				msg = "module '%s' has no function or type '%s'"
+				raise util.Error(node, msg % (base, node.name))
+	
+	return mod
@@ -0,0 +1,151 @@
+'''The reach pass leaves out the code objects from the core library that a
+program cannot use, so that they are not type checked, specialized or
+compiled. It runs on the CFGs built by the blocks phase, before types are
+known, so it has to be conservative about calls:
+
+- The roots are the code objects of the program itself, since all of its
+  functions are exported, and the ``str.__init__`` methods called by the
+  run-time library (see ``core/rt.ll``).
+- A module-level function is reached if its name is referenced.
+- A class is live if its name is referenced (this includes type
+  annotations and the declarations of external functions), if it is the
+  type of a literal, or if it is the type of an attribute of a live class.
+- Since the type of an object is not known when one of its methods is
+  called, calling ``x.m()`` reaches the methods called ``m`` of every live
+  class. Operators, conditions and loops call methods implicitly (like
+  ``__add__``, ``__bool__`` and ``__iter__``), and referencing a trait
+  reaches the methods it declares, since objects converted to a trait
+  are called through its vtable.
+- The ``__new__``, ``__init__`` and ``__del__`` methods of a live class
+  are always reached, since objects are created and freed implicitly.
+
+This is only done when the main module is the whole program: otherwise
+the other modules may use any part of the core library, which is compiled
+into the main module (see the program module).
+'''
+
+from . import ast, blocks, typer, util
+import re
+
+ENABLED = True
+
+# Methods that may be called implicitly when evaluating a node
+METHODS = {
+	ast.EQ: ('__eq__', '__ne__'),
+	ast.NE: ('__eq__', '__ne__'),
+	ast.LT: ('__lt__',),
+	ast.GT: ('__gt__',),
+	ast.Add: ('__add__',),
+	ast.Sub: ('__sub__',),
+	ast.Mul: ('__mul__',),
+	ast.Div: ('__div__',),
+	ast.Mod: ('__mod__',),
+	ast.BWAnd: ('__and__',),
+	ast.BWOr: ('__or__',),
+	ast.BWXor: ('__xor__',),
+	ast.Not: ('__bool__',),
+	ast.And: ('__bool__',),
+	ast.Or: ('__bool__',),
+	ast.Ternary: ('__bool__',),
+	blocks.CondBranch: ('__bool__',),
+	blocks.LoopSetup: ('__iter__',),
+}
+
+LITERALS = {ast.Bool: 'bool', ast.Int: 'int', ast.Float: 'float', ast.String: 'str'}
+ALWAYS = {'__new__', '__init__', '__del__'}
+RUNTIME = {'str'} # the run-time library calls str.__init__()
+
+def scan(obj, names, methods):
+	'''Add the names referenced in `obj` to the set `names` and the names
+	of the methods it may call to the set `methods`'''
+	
+	if isinstance(obj, ast.Name):
+		names.add(obj.name)
+	elif isinstance(obj, ast.Attrib):
+		methods.add(obj.attrib)
+	elif isinstance(obj, blocks.LPad):
+		names.update(obj.map)
+	
+	methods.update(METHODS.get(type(obj), ()))
+	if type(obj) in LITERALS:
+		names.add(LITERALS[type(obj)])
+	
+	if isinstance(obj, (list, tuple)):
+		for e in obj:
+			scan(e, names, methods)
+	elif isinstance(obj, dict):
+		for e in util.values(obj):
+			scan(e, names, methods)
+	elif hasattr(obj, '__dict__') or hasattr(obj, '__slots__'):
+		for k, v in util.items(util.attribs(obj)):
+			if k not in util.IGNORE:
+				scan(v, names, methods)
+
+def refs(fun, names, methods):
+	'''Scan the signature and the CFG of the code object `fun`'''
+	scan((fun.args, fun.rtype), names, methods)
+	for bl in util.values(fun.flow.blocks):
+		scan(bl.steps, names, methods)
+
+def lookup(path):
+	'''Returns the external declaration for the dotted `path` of an
+	imported name (see ``typer.ROOT``), or None'''
+	ns = typer.ROOT
+	for name in path.split('.'):
+		ns = getattr(ns, 'attribs', {}).get(name)
+	return ns if isinstance(ns, typer.Decl) else None
+
+def define(mod, name, names, methods, live):
+	'''Process a newly referenced `name`: add the types and methods it
+	makes available to `names`, `methods` and the set of `live` classes'''
+	
+	obj = mod.names.get(name)
+	if isinstance(obj, str):
+		obj = lookup(obj)
+	
+	if isinstance(obj, ast.Class):
+		live.add(name)
+		scan((obj.params, obj.attribs), names, methods)
+	elif isinstance(obj, ast.Trait):
+		methods.update(m.name.name for m in obj.methods)
+	elif isinstance(obj, ast.Decl):
+		scan((obj.args, obj.rtype), names, methods)
+	elif isinstance(obj, typer.Decl):
+		names.update(re.findall(r'\w+', ' '.join((obj.rtype,) + obj.atypes)))
+	
+	if name == 'bool': # values are converted to bool by calling __bool__()
+		methods.add('__bool__')
+
+def prune(mod, roots):
+	'''Remove the code objects in `mod` that cannot be reached from the
+	first `roots` code objects'''
+	
+	names, methods, live = set(RUNTIME), set(), set()
+	reached = set(range(roots))
+	pending, done = list(range(roots)), set()
+	while pending:
+		
+		for i in pending:
+			refs(mod.code[i][1], names, methods)
+		
+		while names - done:
+			for name in sorted(names - done):
+				done.add(name)
+				define(mod, name, names, methods, live)
+		
+		pending = []
+		for i, (k, fun) in enumerate(mod.code):
+			if i in reached:
+				continue
+			if isinstance(k, str) and k in names:
+				pending.append(i)
+			elif not isinstance(k, str) and k[0] in live:
+				if k[1] in methods or k[1] in ALWAYS:
+					pending.append(i)
+		
+		reached.update(pending)
+	
+	util.note('core library: %i of %i code objects reachable' % (
+		len(reached) - roots, len(mod.code) - roots,
+	))
+	mod.code = [e for (i, e) in enumerate(mod.code) if i in reached]
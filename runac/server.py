@@ -0,0 +1,182 @@
+'''A compile server that keeps the compiler warm.
+
+``runa serve`` starts a daemon listening on a Unix socket. It loads
+everything that does not depend on the program being compiled once: the
+compiler modules, the parser tables and the core library. ``runa compile
+--server`` then sends the file to compile to the daemon rather than doing
+the work itself.
+
+Each request is handled in a child process forked from the daemon, so the
+child starts out with all of the warm state, and nothing a compilation
+changes (the module, ``types.INTS`` and friends, statistics, open files)
+survives the request. This also means that requests are handled
+concurrently, and that a crash in the compiler does not take down the
+daemon.
+
+The protocol is a single line of JSON in each direction per connection.
+A request contains the absolute path of the source file and the output
+file and the compiler options; the response contains the output file name
+(or null, if nothing was built) and the diagnostics, which include anything
+the compiler or clang wrote to stdout or stderr.
+'''
+
+from __future__ import print_function
+from . import cache, util
+import errno, json, os, signal, socket, sys, tempfile, traceback
+
+def address():
+	'''Returns the path of the server socket: ``RUNA_SOCKET`` if it is set,
+	or a file in the cache directory'''
+	if os.environ.get('RUNA_SOCKET'):
+		return os.environ['RUNA_SOCKET']
+	return os.path.join(cache.directory(), 'serve.sock')
+
+def warm():
+	'''Load everything that does not depend on the program being compiled'''
+	import runac
+	from . import parser
+	from . import incremental # imported lazily by runac; load it before forking
+	parser.build()
+	list(runac.passes())
+	runac.core()
+	cache.version()
+
+def receive(conn):
+	'''Read a line of JSON from the socket `conn`'''
+	data = b''
+	while not data.endswith(b'\n'):
+		bit = conn.recv(65536)
+		if not bit:
+			break
+		data += bit
+	return json.loads(data.decode('utf-8'))
+
+def send(conn, obj):
+	conn.sendall(json.dumps(obj).encode('utf-8') + b'\n')
+
+def compile(req):
+	'''Compile the file from the request, returning the response'''
+	import runac
+	
+	out = req['outfile']
+	if os.path.exists(out):
+		os.unlink(out)
+	
+	diag = ''
+	try:
+		runac.build(req['file'], out, req['level'], req['march'], req['mcpu'],
+		            req['passes'])
+	except (util.Error, util.ParseError) as e:
+		diag = e.show()
+	except Exception:
+		diag = traceback.format_exc()
+	
+	built = out if os.path.exists(out) else None
+	return {'output': built, 'diagnostics': diag}
+
+def handle(conn):
+	'''Handle a request in a forked child process. Output from the compiler
+	and from clang (which inherits the file descriptors) is captured and
+	returned as part of the diagnostics.'''
+	
+	req = receive(conn)
+	if req.get('version') != cache.version():
+		msg = 'error: the server runs a different version of the compiler\n'
+		send(conn, {'output': None, 'diagnostics': msg})
+		return
+	
+	os.chdir(req['cwd'])
+	util.VERBOSE = req['verbose']
+	cache.ENABLED = cache.ENABLED and req['cache']
+	
+	log = tempfile.TemporaryFile()
+	sys.stdout.flush()
+	sys.stderr.flush()
+	os.dup2(log.fileno(), 1)
+	os.dup2(log.fileno(), 2)
+	res = compile(req)
+	sys.stdout.flush()
+	sys.stderr.flush()
+	
+	log.seek(0)
+	res['diagnostics'] = log.read().decode('utf-8', 'replace') + res['diagnostics']
+	send(conn, res)
+
+def serve(path=None):
+	'''Run the compile server on the Unix socket at `path` (by default,
+	see ``address()``) until interrupted'''
+	
+	if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'):
+		print('error: the compile server needs Unix sockets and fork()')
+		return
+	
+	path = path or address()
+	if os.path.exists(path):
+		try:
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			probe.connect(path)
+			probe.close()
+			print('error: a server is already listening on %s' % path)
+			return
+		except socket.error:
+			os.unlink(path) # left behind by a server that died
+	
+	if not os.path.isdir(os.path.dirname(path) or '.'):
+		os.makedirs(os.path.dirname(path))
+	
+	warm()
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.bind(path)
+	sock.listen(64)
+	signal.signal(signal.SIGCHLD, signal.SIG_IGN) # reap children
+	signal.signal(signal.SIGTERM, lambda num, frame: sys.exit(0))
+	util.note('listening on %s' % path)
+	
+	try:
+		while True:
+			
+			try:
+				conn, addr = sock.accept()
+			except socket.error as e:
+				if e.args[0] == errno.EINTR:
+					continue
+				raise
+			
+			if os.fork():
+				conn.close()
+				continue
+			
+			status = 1
+			try:
+				signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+				signal.signal(signal.SIGTERM, signal.SIG_DFL)
+				sock.close()
+				handle(conn)
+				status = 0
+			finally:
+				os._exit(status)
+	
+	except KeyboardInterrupt:
+		pass
+	finally:
+		sock.close()
+		os.unlink(path)
+
+def request(req, path=None):
+	'''Send a compile request to the server and return the response. The
+	file names in `req` are made absolute first, since the server might
+	run in a different directory.'''
+	
+	req = dict(req)
+	req['file'] = os.path.abspath(req['file'])
+	req['outfile'] = os.path.abspath(req['outfile'])
+	req['cwd'] = os.getcwd()
+	req['version'] = cache.version()
+	
+	conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	conn.connect(path or address())
+	try:
+		send(conn, req)
+		return receive(conn)
+	finally:
+		conn.close()
@@ -0,0 +1,220 @@
+'''The simplify pass cleans up the CFGs built by the blocks phase before
+any analysis runs on them, so that later passes and the generated code
+have fewer blocks to deal with:
+
+- Jumps to blocks that only contain a ``Branch`` are threaded through to
+  the final target of the chain of branches.
+- Blocks that are not reachable from the entry block are removed. A ``Phi``
+  with one side coming from such a block is replaced by the other side.
+- A block that is only entered from a block ending in a ``Branch`` to it
+  is merged into that block.
+- The remaining blocks are numbered consecutively, keeping their order.
+
+Some blocks are left alone: the entry block, blocks that generators resume
+at (their address is taken), landing pads and exception handlers, and
+blocks mentioned by a ``Phi`` or by the checks
+recorded on the edges of the CFG (which the type checker looks up by block
+ID). The edges, ``checks`` and ``yields`` of the flow graph
+are kept consistent with the steps.
+'''
+
+from . import ast, blocks, util
+
+def calls(step):
+	'''Returns the call with exception edges in `step`, if any'''
+	call = step if isinstance(step, ast.Call) else getattr(step, 'right', None)
+	if isinstance(call, ast.Call) and call.callbr is not None:
+		return call
+	return None
+
+def phis(step):
+	'''Returns the Phi node in `step`, if any'''
+	right = getattr(step, 'right', None)
+	return right if isinstance(right, blocks.Phi) else None
+
+def retarget(step, old, new):
+	'''Changes jumps to block `old` in `step` to go to block `new` instead.
+	Returns False if `step` does not jump to `old` explicitly.'''
+	
+	res = False
+	if isinstance(step, blocks.Branch) and step.label == old:
+		step.label, res = new, True
+	elif isinstance(step, (blocks.CondBranch, blocks.LoopHeader)):
+		if step.tg1 == old:
+			step.tg1, res = new, True
+		if step.tg2 == old:
+			step.tg2, res = new, True
+	elif calls(step) is not None and calls(step).callbr[0] == old:
+		call = calls(step)
+		call.callbr, res = (new, call.callbr[1]), True
+	return res
+
+def renumber(step, map):
+	'''Changes all block IDs in `step` according to `map`'''
+	
+	if isinstance(step, blocks.Branch):
+		step.label = map[step.label]
+	elif isinstance(step, (blocks.CondBranch, blocks.LoopHeader)):
+		step.tg1 = map.get(step.tg1, step.tg1)
+		step.tg2 = map.get(step.tg2, step.tg2)
+	elif isinstance(step, ast.Yield):
+		step.target = map[step.target]
+	elif isinstance(step, blocks.LPad):
+		step.map = {k: map[v] for (k, v) in util.items(step.map)}
+	
+	call, phi = calls(step), phis(step)
+	if call is not None:
+		call.callbr = tuple(map.get(id, id) for id in call.callbr)
+	if phi is not None:
+		phi.left = map[phi.left[0]], phi.left[1]
+		phi.right = map[phi.right[0]], phi.right[1]
+
+def pinned(flow):
+	'''Returns the IDs of blocks that may not be threaded or merged away'''
+	
+	res = {0} | set(util.values(flow.yields))
+	for src, dst in flow.checks:
+		res.update((src, dst))
+	
+	for bl in util.values(flow.blocks):
+		for step in bl.steps:
+			if isinstance(step, blocks.LPad):
+				res.update(util.values(step.map))
+			if calls(step) is not None:
+				res.add(calls(step).callbr[1])
+			if phis(step) is not None:
+				res.update((phis(step).left[0], phis(step).right[0]))
+	
+	return res
+
+def forward(flow, id):
+	'''Returns the block `id` jumps to, if it only contains a Branch'''
+	steps = flow.blocks[id].steps
+	if len(steps) == 1 and isinstance(steps[0], blocks.Branch):
+		return steps[0].label
+	return None
+
+def thread(flow, edges, keep):
+	'''Thread jumps through blocks that only contain a Branch. Returns True
+	if anything changed.'''
+	
+	changed = False
+	for src, dsts in sorted(util.items(edges)):
+		
+		if src not in flow.blocks or not flow.blocks[src].steps:
+			continue
+		
+		last, done = flow.blocks[src].steps[-1], {}
+		for i, dst in enumerate(dsts):
+			
+			if dst in done:
+				dsts[i] = done[dst]
+				continue
+			
+			seen, cur = {src}, dst
+			while cur not in keep and cur not in seen:
+				nxt = forward(flow, cur)
+				if nxt is None:
+					break
+				seen.add(cur)
+				cur = nxt
+			
+			if cur != dst and retarget(last, dst, cur):
+				dsts[i] = done[dst] = cur
+				changed = True
+	
+	return changed
+
+def reachable(edges):
+	'''Returns the set of IDs of blocks reachable from the entry block'''
+	seen, stack = {0}, [0]
+	while stack:
+		for dst in edges.get(stack.pop(), ()):
+			if dst not in seen:
+				seen.add(dst)
+				stack.append(dst)
+	return seen
+
+def prune(flow, edges):
+	'''Remove blocks that are not reachable from the entry block. Returns
+	True if anything changed.'''
+	
+	dead = set(flow.blocks) - reachable(edges)
+	for id in dead:
+		del flow.blocks[id]
+		edges.pop(id, None)
+		flow.yields.pop(id, None)
+	
+	for bl in util.values(flow.blocks):
+		for step in bl.steps:
+			phi = phis(step)
+			if phi is not None and phi.left[0] in dead:
+				step.right = phi.right[1]
+			elif phi is not None and phi.right[0] in dead:
+				step.right = phi.left[1]
+	
+	for key in [k for k in flow.checks if k[0] in dead]:
+		del flow.checks[key]
+	return bool(dead)
+
+def merge(flow, edges, keep):
+	'''Merge blocks into the block that branches to them, if that is their
+	only predecessor. Returns True if anything changed.'''
+	
+	count = {}
+	for src, dsts in util.items(edges):
+		for dst in dsts:
+			count[dst] = count.get(dst, 0) + 1
+	
+	changed = False
+	for id in sorted(flow.blocks):
+		
+		if id not in flow.blocks:
+			continue
+		
+		bl = flow.blocks[id]
+		while bl.steps and isinstance(bl.steps[-1], blocks.Branch):
+			
+			dst = bl.steps[-1].label
+			if dst == id or dst in keep or count.get(dst) != 1:
+				break
+			if dst in flow.yields or bl.returns or bl.raises:
+				break
+			
+			next = flow.blocks.pop(dst)
+			bl.steps = bl.steps[:-1] + next.steps
+			bl.returns, bl.raises = next.returns, next.raises
+			edges[id] = edges.pop(dst, [])
+			changed = True
+	
+	return changed
+
+def compact(flow, edges):
+	'''Number the blocks consecutively and link the `edges` again'''
+	
+	map = {old: new for (new, old) in enumerate(flow.blocks)}
+	res = blocks.Blocks()
+	for old, bl in util.items(flow.blocks):
+		bl.id = map[old]
+		for step in bl.steps:
+			renumber(step, map)
+		res[bl.id] = bl
+	
+	flow.blocks = res
+	flow.checks = {(map[s], map[d]): v for ((s, d), v) in util.items(flow.checks)}
+	flow.yields = {map[s]: map[d] for (s, d) in util.items(flow.yields)}
+	flow.link({map[s]: [map[d] for d in ds] for (s, ds) in util.items(edges)})
+
+def cleanup(code):
+	flow = code.flow
+	edges, keep = flow.edges, pinned(flow)
+	changed = thread(flow, edges, keep)
+	if prune(flow, edges):
+		changed, keep = True, pinned(flow) # Phis may have been removed
+	changed = merge(flow, edges, keep) or changed
+	if changed:
+		compact(flow, edges)
+
+def simplify(mod):
+	for name, code in mod.code:
+		cleanup(code)
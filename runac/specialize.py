@@ -10,7 +10,7 @@ see if it makes sense to change int to be ``i32``. Currently, we only have
 a single float type; it seems like ``float`` == ``f64`` might make sense.
 '''
 
-from . import ast, types, util
+from . import ast, dataflow, types
 
 class Specializer(object):
 	
@@ -71,6 +71,9 @@ class Specializer(object):
 		elif types.generic(node.right.type):
 			self.visit(node.right, node.left.type)
 			self.visit(node.left)
+		else: # a cast operand may still hold an untyped literal
+			self.visit(node.left)
+			self.visit(node.right)
 	
 	# Constants
 	
@@ -276,8 +279,8 @@ class Specializer(object):
 		pass
 	
 	def propagate(self):
-		for i, bl in util.items(self.cfg.blocks):
-			for step in reversed(bl.steps):
+		for i in reversed(dataflow.order(self.cfg)):
+			for step in reversed(self.cfg.blocks[i].steps):
 				self.visit(step)
 
 def specialize(mod):
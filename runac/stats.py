@@ -0,0 +1,227 @@
+'''Timing and memory statistics for the phases of the compiler.
+
+Compiler phases are wrapped in a ``Phase`` context manager, which records
+the wall time, the peak memory allocated (as traced by ``tracemalloc``) and
+the number of blocks and nodes in the code processed, if enabled. Dataflow
+analyses also count the blocks they visit until they converge, and the
+caches in the types module count lookups and hits. Passes
+that run over a single function record the function name, so that the
+report can be broken down both by phase and by function.
+
+Recording is disabled by default; the driver enables it with the
+``--time-passes`` and ``--mem-passes`` options. Phases can be nested (code
+generation runs while the IR is streamed into clang, for example), so the
+report also includes the total wall time since recording was enabled and the
+overall peak memory use.
+'''
+
+from . import util
+import json, sys, time
+
+try:
+	import tracemalloc
+except ImportError: # Python 2
+	tracemalloc = None
+
+TIME = False
+MEMORY = False
+RECORDS = []
+COUNTS = {}
+STACK = []
+START = None
+PEAK = 0
+
+def enable(timing=True, memory=False):
+	'''Start recording statistics. Memory usage is only recorded if the
+	tracemalloc module can reset its peak (Python 3.9 and later).'''
+	global TIME, MEMORY, START
+	TIME = timing
+	MEMORY = memory and hasattr(tracemalloc, 'reset_peak')
+	if memory and not MEMORY:
+		sys.stderr.write('warning: memory use is only recorded on Python 3.9+\n')
+	START = time.time()
+	if MEMORY and not tracemalloc.is_tracing():
+		tracemalloc.start()
+
+def reset():
+	'''Reset the peak memory traced by tracemalloc, if it can be reset'''
+	if hasattr(tracemalloc, 'reset_peak'):
+		tracemalloc.reset_peak()
+
+def fname(key):
+	'''Returns a printable name for a code object key'''
+	return key if isinstance(key, str) else '.'.join(key)
+
+def size(obj):
+	'''Returns the number of blocks and nodes in a Module, a function or a
+	syntax tree'''
+	
+	if hasattr(obj, 'code'):
+		blocks, nodes = 0, 0
+		for k, fun in obj.code:
+			bits = size(fun)
+			blocks, nodes = blocks + bits[0], nodes + bits[1]
+		return blocks, nodes
+	
+	stack, blocks, nodes = [obj], 0, 0
+	if hasattr(obj, 'flow'):
+		stack = [bl.steps for bl in util.values(obj.flow.blocks)]
+		blocks = len(stack)
+	
+	while stack:
+		node = stack.pop()
+		if isinstance(node, list):
+			stack += node
+		elif hasattr(node, 'fields'):
+			nodes += 1
+			stack += [getattr(node, k, None) for k in node.fields]
+	
+	return blocks, nodes
+
+class Phase(object):
+	'''Context manager measuring a phase. `key` is the name of the function
+	being processed (if any); `obj` is used to count blocks and nodes after
+	the phase has run, and can also be set later.'''
+	
+	def __init__(self, name, key=None, obj=None):
+		self.name = name
+		self.key = key
+		self.obj = obj
+		self.peak = 0
+	
+	def __enter__(self):
+		if not TIME and not MEMORY:
+			return self
+		if MEMORY:
+			self.base = tracemalloc.get_traced_memory()[0]
+			reset()
+		STACK.append(self)
+		self.start = time.time()
+		return self
+	
+	def __exit__(self, type, value, tb):
+		
+		if not TIME and not MEMORY:
+			return
+		
+		rec = {
+			'phase': self.name,
+			'function': None if self.key is None else fname(self.key),
+			'time': time.time() - self.start,
+		}
+		
+		global PEAK
+		STACK.pop()
+		if MEMORY:
+			# nested phases reset the peak, so keep track of theirs
+			peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+			rec['memory'] = peak - self.base
+			PEAK = max(PEAK, peak)
+			if STACK:
+				STACK[-1].peak = max(STACK[-1].peak, peak)
+			reset()
+		
+		if self.obj is not None:
+			rec['blocks'], rec['nodes'] = size(self.obj)
+		RECORDS.append(rec)
+
+def count(name, **values):
+	'''Add `values` to the counters for `name` (like the number of blocks
+	visited by a dataflow analysis), if recording is enabled'''
+	if not TIME and not MEMORY:
+		return
+	total = COUNTS.setdefault(name, {})
+	for k, v in util.items(values):
+		total[k] = total.get(k, 0) + v
+
+def summarize(field):
+	'''Returns a dict mapping values for `field` (like 'phase' or
+	'function') to totals. Times are summed and memory use is the maximum
+	of all records. Block and node counts are summed over the functions
+	processed in a phase; for a function, the last count is used.'''
+	
+	res = {}
+	for rec in RECORDS:
+		
+		if rec[field] is None:
+			continue
+		
+		total = res.setdefault(rec[field], {'time': 0.0})
+		total['time'] += rec['time']
+		if 'memory' in rec:
+			total['memory'] = max(total.get('memory', 0), rec['memory'])
+		for k in ('blocks', 'nodes'):
+			if k in rec and field == 'function':
+				total[k] = rec[k]
+			elif k in rec:
+				total[k] = total.get(k, 0) + rec[k]
+	
+	return res
+
+def total():
+	'''Returns the wall time since recording was enabled and the peak
+	memory use (or None, if memory usage was not recorded)'''
+	return time.time() - START, PEAK if MEMORY else None
+
+def table(title, totals, order):
+
+	bits = title, 'time (ms)', 'peak (KiB)', 'blocks', 'nodes'
+	head = '%-32s %10s %12s %8s %8s' % bits
+	lines = [head, '-' * len(head)]
+	for k in order:
+		t = totals[k]
+		mem = '%.1f' % (t['memory'] / 1024.0) if 'memory' in t else '-'
+		bits = k, t['time'] * 1000, mem, t.get('blocks', '-'), t.get('nodes', '-')
+		lines.append('%-32s %10.2f %12s %8s %8s' % bits)
+	return '\n'.join(lines) + '\n'
+
+def report(file=sys.stderr):
+	'''Write a human-readable report of the recorded statistics'''
+	
+	phases, seen = summarize('phase'), []
+	for rec in RECORDS:
+		if rec['phase'] not in seen:
+			seen.append(rec['phase'])
+	
+	functions = summarize('function')
+	order = sorted(functions, key=lambda k: -functions[k]['time'])
+	file.write(table('phase', phases, seen) + '\n')
+	file.write(table('function', functions, order) + '\n')
+	
+	analyses = [(k, c) for (k, c) in util.items(COUNTS) if 'visits' in c]
+	if analyses:
+		bits = 'analysis', 'runs', 'blocks', 'rounds', 'visits', 'visits/block'
+		head = '%-32s %8s %8s %8s %8s %12s' % bits
+		lines = [head, '-' * len(head)]
+		for k, c in sorted(analyses):
+			ratio = c['visits'] / float(c['blocks'] or 1)
+			bits = k, c['runs'], c['blocks'], c['rounds'], c['visits'], ratio
+			lines.append('%-32s %8i %8i %8i %8i %12.2f' % bits)
+		file.write('\n'.join(lines) + '\n\n')
+	
+	caches = [(k, c) for (k, c) in util.items(COUNTS) if 'lookups' in c]
+	if caches:
+		head = '%-32s %8s %8s %12s' % ('cache', 'lookups', 'hits', 'hit rate')
+		lines = [head, '-' * len(head)]
+		for k, c in sorted(caches):
+			hits = c.get('hits', 0)
+			rate = '%.1f%%' % (hits * 100.0 / c['lookups'])
+			lines.append('%-32s %8i %8i %12s' % (k, c['lookups'], hits, rate))
+		file.write('\n'.join(lines) + '\n\n')
+	
+	wall, peak = total()
+	mem = ', peak memory %.1f KiB' % (peak / 1024.0) if peak is not None else ''
+	file.write('total: %.2f ms%s\n' % (wall * 1000, mem))
+
+def dump(fn):
+	'''Write the recorded statistics to the file `fn` as JSON'''
+	wall, peak = total()
+	data = {
+		'total': {'time': wall, 'memory': peak},
+		'records': RECORDS,
+		'phases': summarize('phase'),
+		'functions': summarize('function'),
+		'counts': COUNTS,
+	}
+	with open(fn, 'w') as f:
+		json.dump(data, f, indent=1, sort_keys=True)
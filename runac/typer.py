@@ -43,6 +43,7 @@ class Object(util.AttribRepr):
 		self.type = type
 
 class Init(ast.Expr):
+	__slots__ = ()
 	def __init__(self, type):
 		ast.Expr.__init__(self, None)
 		self.type = type
@@ -305,6 +306,9 @@ class TypeChecker(object):
 		elif lt in types.INTS:
 			assert rt in types.INTS
 			node.type = node.left.type
+		elif lt in types.FLOATS:
+			assert rt in types.FLOATS
+			node.type = node.left.type
 		else:
 			assert False, op + ' sides different types'
 	
@@ -452,7 +456,7 @@ class TypeChecker(object):
 			if node.name.obj.type is None:
 				self.visit(node.name.obj, scope)
 			
-			if node.name.obj.type == types.module():
+			if isinstance(node.name.obj.type, types.module):
 				
 				# calling a module attribute
 				mod = scope[node.name.obj.name]
@@ -641,7 +645,7 @@ def variant(mod, t):
 
 VOID = {'__init__', '__del__'}
 
-def process(mod, base, fun):
+def process(mod, base, key, fun):
 	
 	if fun.name.name in VOID and fun.rtype is not None:
 		msg = "method '%s' must return type 'void'"
@@ -664,7 +668,7 @@ def process(mod, base, fun):
 	
 	if fun.flow.yields:
 		
-		if '.' in fun.irname:
+		if isinstance(key, tuple):
 			mcls = types.unwrap(fun.args[0].type)
 			defn = mcls.methods[fun.name.name][0]
 		else:
@@ -682,10 +686,15 @@ def process(mod, base, fun):
 	checker = TypeChecker(mod, fun)
 	checker.check(start)
 
-def typer(mod):
+def prepare(mod):
+	'''Set up the module scope (``mod.scope``): realize types for classes,
+	traits and declarations, add constants and imports, and build function
+	definitions for module-level functions. This must be done before any
+	code object can be checked.'''
 	
 	# Start by adding types to type dictionary
 	
+	types.reset()
 	for k, v in util.items(mod.names):
 		if isinstance(v, (ast.Class, ast.Trait)):
 			mod.types.add(v)
@@ -738,7 +747,7 @@ def typer(mod):
 	# Process module-level functions: build function definition object,
 	# set IR name and check for types (in particular for "main")
 	
-	for k, fun in mod.code:
+	for k, fun in mod.code + mod.external:
 		
 		if not isinstance(k, str):
 			continue
@@ -755,9 +764,10 @@ def typer(mod):
 			rtype = mod.types.get(fun.rtype)
 		
 		type = types.function(rtype, tuple(i[0] for i in args))
-		type.args = tuple(i[1] for i in args)
-		base[fun.name.name] = types.FunctionDef(fun.name.name, type)
-		fun.irname = fun.name.name
+		if getattr(fun, 'irname', None) is None:
+			fun.irname = fun.name.name # prefixed in imported modules
+		names = tuple(i[1] for i in args)
+		base[fun.name.name] = types.FunctionDef(fun.irname, type, names)
 		
 		if k == 'main' and args and args[0][0] != types.ref(base['str']):
 			msg = '1st argument to main() must be of type &str'
@@ -771,28 +781,36 @@ def typer(mod):
 		if k == 'main' and rtype not in {types.void(), base['i32']}:
 			raise util.Error(fun, 'main() return type must be i32')
 	
-	# Handle type checking and inference on all code objects
-	
 	mod.scope = base
+
+def check(mod, k, fun):
+	'''Type check and infer types for a single code object, after the
+	module scope has been set up by ``prepare()``.'''
+	
+	base = mod.scope
+	
+	# Check type invariants on methods
+	if isinstance(k, tuple) and k[1] != '__new__':
+		if not fun.args:
+			raise util.Error(fun, "missing 'self' argument")
+		elif fun.args[0].name.name != 'self':
+			msg = "first method argument must be called 'self'"
+			raise util.Error(fun.args[0], msg)
+		elif fun.args[0].type is not None:
+			if fun.args[0].type.name != k[0]:
+				msg = "first method argument must be of type '%s'"
+				raise util.Error(fun.args[0].type, msg % k[0])
+	
+	# Pass self as owner to __del__ methods
+	if fun.args and fun.args[0].type is None:
+		if fun.name.name == '__del__':
+			fun.args[0].type = types.owner(base[k[0]])
+		else:
+			fun.args[0].type = types.ref(base[k[0]])
+	
+	process(mod, base, k, fun)
+
+def typer(mod):
+	prepare(mod)
 	for k, fun in mod.code:
-		
-		# Check type invariants on methods
-		if isinstance(k, tuple) and k[1] != '__new__':
-			if not fun.args:
-				raise util.Error(fun, "missing 'self' argument")
-			elif fun.args[0].name.name != 'self':
-				msg = "first method argument must be called 'self'"
-				raise util.Error(fun.args[0], msg)
-			elif fun.args[0].type is not None:
-				if fun.args[0].type.name != k[0]:
-					msg = "first method argument must be of type '%s'"
-					raise util.Error(fun.args[0].type, msg % k[0])
-		
-		# Pass self as owner to __del__ methods
-		if fun.args and fun.args[0].type is None:
-			if fun.name.name == '__del__':
-				fun.args[0].type = types.owner(base[k[0]])
-			else:
-				fun.args[0].type = types.ref(base[k[0]])
-		
-		process(mod, base, fun)
+		check(mod, k, fun)
@@ -15,7 +15,7 @@ core library. Additionally, helpers are provided for template types and their
 concrete variants; these are used for traits and generics support.
 '''
 
-from . import ast, util
+from . import ast, stats, util
 import copy, platform
 
 WORD_SIZE = int(platform.architecture()[0][:2])
@@ -48,25 +48,41 @@ BASIC_FLOATS = {'float': 64}
 class Type(object):
 	def __eq__(self, other):
 		return self.__class__ == other.__class__
+	def __hash__(self):
+		return hash(self.__class__)
 
 class FunctionDef(util.AttribRepr):
-	def __init__(self, decl, type):
+	def __init__(self, decl, type, args=None):
 		self.decl = decl
 		self.type = type
 		self.name = decl # might be overridden by the Module
+		self.args = args # argument names
 
-class ReprId(object):
+class Interned(object):
+	'''Base class for types. Types are interned: calling a type class with
+	the same arguments (for wrappers and functions, these are types) returns
+	the same object every time, so that types are compared by identity and
+	hashed by their id, instead of comparing their names.'''
 	
-	def __hash__(self):
-		return hash(repr(self))
+	def __new__(cls, *args):
+		table = cls.__dict__.get('interned')
+		if table is None:
+			table = cls.interned = {}
+		res = table.get(args)
+		if res is None:
+			res = table[args] = object.__new__(cls)
+		return res
 	
-	def __eq__(self, other):
-		return repr(self) == repr(other)
+	def __copy__(self):
+		return self
 	
-	def __ne__(self, other):
-		return not self.__eq__(other)
+	def __deepcopy__(self, memo):
+		return self
 	
 	def select(self, node, name, actual):
+		'''Returns the overload of method `name` that fits the `actual`
+		argument types. The result is cached per type, name and argument
+		types (see reset()).'''
 		
 		if name not in self.methods:
 			msg = "%s does not have a method '%s'"
@@ -78,6 +94,12 @@ class ReprId(object):
 				assert False, node
 			raise util.Error(node, msg % (t, name))
 		
+		key = self, name, tuple(actual)
+		if key in DISPATCH:
+			stats.count('select', lookups=1, hits=1)
+			return DISPATCH[key]
+		
+		stats.count('select', lookups=1)
 		opts = copy.copy(self.methods[name])
 		if name == '__init__' and '__new__' in self.methods:
 			opts += self.methods['__new__']
@@ -114,9 +136,10 @@ class ReprId(object):
 			raise util.Error(node, msg % bits)
 		
 		assert len(res) == 1, res
+		DISPATCH[key] = res[0]
 		return res[0]
 
-class base(ReprId):
+class base(Interned):
 	
 	byval = False
 	attribs = {}
@@ -134,7 +157,7 @@ class base(ReprId):
 	def __repr__(self):
 		return '<type: %s>' % self.__class__.__name__
 
-class trait(ReprId):
+class trait(Interned):
 	
 	byval = False
 	attribs = {}
@@ -156,7 +179,7 @@ class concrete(base):
 	attribs = {}
 	methods = {}
 
-class template(ReprId):
+class template(Interned):
 	
 	byval = False
 	attribs = {}
@@ -204,6 +227,10 @@ class anyfloat(base):
 		assert False, 'not a concrete type'
 
 class module(base):
+	
+	def __new__(cls, path=None):
+		return object.__new__(cls) # not interned: each has its functions
+	
 	def __init__(self, path=None):
 		self.path = path
 		self.functions = {}
@@ -262,11 +289,33 @@ INTS = {anyint()}
 FLOATS = {anyfloat()}
 WRAPPERS = owner, ref
 
+COMPAT = {} # (actual, formal, strict) -> result of compat()
+DISPATCH = {} # (type, method name, actual types) -> FunctionDef
+
+def reset():
+	'''Forget the numeric types registered by TypeMap.fill(), the interned
+	types and the results cached by compat() and select(), so that types
+	from a module compiled earlier in the same process do not leak into the
+	next one, nor stay alive after it'''
+	classes = [Interned]
+	while classes:
+		cls = classes.pop()
+		cls.__dict__.get('interned', {}).clear()
+		classes += cls.__subclasses__()
+	for group in (SINTS, UINTS, INTS, FLOATS):
+		group.clear()
+	COMPAT.clear()
+	DISPATCH.clear()
+	SINTS.add(anyint())
+	INTS.add(anyint())
+	FLOATS.add(anyfloat())
+	anyint.methods = {}
+	anyfloat.methods = {}
+
 class function(base):
 	
 	def __init__(self, rtype, formal):
 		self.over = rtype, formal
-		self.args = None
 	
 	def __repr__(self):
 		if not self.over[1] or isinstance(self.over[1][0], tuple):
@@ -296,9 +345,9 @@ def wrangle(s):
 	return s
 
 def compat(a, f, strict=False):
-	
-	if isinstance(a, concrete) and isinstance(f, concrete):
-		return all(compat(i[0], i[1], True) for i in zip(a.params, f.params))
+	'''Returns True if a value of type `a` may be used where type `f` is
+	expected (or, for sequences of types, if each of the types in `a` fits
+	the corresponding one in `f`). Results for types are cached.'''
 	
 	if isinstance(a, (tuple, list)) and isinstance(f, (tuple, list)):
 		if len(a) != len(f):
@@ -307,10 +356,30 @@ def compat(a, f, strict=False):
 			return all(compat(i[0], i[1]) for i in zip(a, f[:-1]))
 		return all(compat(i[0], i[1]) for i in zip(a, f))
 	
+	if a is f:
+		return True
+	
+	key = a, f, strict
+	res = COMPAT.get(key)
+	if res is None:
+		res = COMPAT[key] = check(a, f, strict)
+		stats.count('compat', lookups=1)
+	elif stats.TIME: # skip the call on this hot path unless recording
+		stats.count('compat', lookups=1, hits=1)
+	return res
+
+def check(a, f, strict):
+	'''Implements compat() for a pair of types'''
+	
+	if isinstance(a, concrete) and isinstance(f, concrete):
+		return all(compat(i[0], i[1], True) for i in zip(a.params, f.params))
+	
 	if a == f:
 		return True
 	elif isinstance(a, anyint) and f in INTS:
 		return True
+	elif isinstance(a, anyfloat) and f in FLOATS:
+		return True
 	elif isinstance(a, ref) and isinstance(f, owner):
 		return False
 	elif isinstance(f, opt) and not isinstance(a, opt):
@@ -471,8 +540,8 @@ class TypeMap(object):
 				irname = irname + '$' + '.'.join(wrangle(a[1].name) for a in args)
 				assert rtype == cls.methods[name][0].type.over[0]
 			
-			fun = FunctionDef(irname, function(rtype, tuple(a[1] for a in args)))
-			fun.type.args = [a[0] for a in args]
+			ftype = function(rtype, tuple(a[1] for a in args))
+			fun = FunctionDef(irname, ftype, [a[0] for a in args])
 			cls.methods.setdefault(name, []).append(fun)
 			method.irname = irname
 		
@@ -498,16 +567,19 @@ class TypeMap(object):
 	def realize(self, n):
 		if isinstance(n, ast.Decl):
 			rtype = self.get(n.rtype)
-			atypes = [self.get(a.type) for a in n.args]
+			atypes = tuple(self.get(a.type) for a in n.args)
 			return FunctionDef(n.name.name, function(rtype, atypes))
 		else:
 			rtype = self.get(n.rtype)
-			atypes = [self.get(t) for t in n.atypes]
+			atypes = tuple(self.get(t) for t in n.atypes)
 			return FunctionDef(n.decl, function(rtype, atypes))
 	
 	def build_tuple(self, params):
 		
 		params = tuple(params)
+		if ('tuple', params) in self:
+			return self[('tuple', params)]()
+		
 		name = 'tuple[%s]' % ', '.join(p.name for p in params)
 		internal = name.replace('%', '_').replace('.', '_')
 		cls = self[('tuple', params)] = type(internal, (concrete,), {
@@ -523,6 +595,9 @@ class TypeMap(object):
 	def apply(self, tpl, params):
 		
 		params = params if isinstance(params, tuple) else (params,)
+		if (tpl.name, params) in self:
+			return self[(tpl.name, params)]()
+		
 		name = '%s[%s]' % (tpl.name, ', '.join(p.name for p in params))
 		internal = name.replace('$', '_').replace('.', '_')
 		cls = self[(tpl.name, params)] = type(internal, (concrete,), {
@@ -1,8 +1,9 @@
-import os, sys
+import os, sys, bisect
 
 BASE = os.path.dirname(os.path.dirname(__file__))
 CORE_DIR = os.path.join(BASE, 'core')
 IGNORE = {'pos'}
+VERBOSE = False
 
 if sys.version_info[0] < 3:
 	def keys(d):
@@ -11,6 +12,8 @@ if sys.version_info[0] < 3:
 		return d.itervalues()
 	def items(d):
 		return d.iteritems()
+	import __builtin__
+	intern = __builtin__.intern
 else:
 	def keys(d):
 		return d.keys()
@@ -18,14 +21,80 @@ else:
 		return d.values()
 	def items(d):
 		return d.items()
+	intern = sys.intern
+
+def note(msg):
+	'''Write a diagnostic message to stderr if verbose output is enabled'''
+	if VERBOSE:
+		sys.stderr.write(msg + '\n')
+
+def attribs(obj):
+	'''Returns a dict of the attributes set on `obj`, including those
+	stored in slots (declared by `obj`'s class or any of its bases)'''
+	res = dict(getattr(obj, '__dict__', ()))
+	for cls in type(obj).__mro__:
+		for k in cls.__dict__.get('__slots__', ()):
+			if k not in res and hasattr(obj, k):
+				res[k] = getattr(obj, k)
+	return res
 
 class AttribRepr(object):
 	'''Helper class to provide a nice __repr__ for other classes'''
+	__slots__ = ()
 	def __repr__(self):
-		contents = sorted(items(self.__dict__))
+		contents = sorted(items(attribs(self)))
 		show = ('%s=%r' % (k, v) for (k, v) in contents if k not in IGNORE)
 		return '<%s(%s)>' % (self.__class__.__name__, ', '.join(show))
 
+class Source(object):
+	'''The contents of a source file, shared by all positions in it'''
+	
+	def __init__(self, fn, text):
+		self.fn = fn
+		self.text = text
+		self.starts = None
+	
+	def __repr__(self):
+		return '<Source(%r)>' % self.fn
+	
+	def location(self, offset):
+		'''Returns the 0-based line and column for an offset into the source,
+		and the contents of that line'''
+		if self.starts is None:
+			self.starts = [0]
+			nl = self.text.find('\n')
+			while nl >= 0:
+				self.starts.append(nl + 1)
+				nl = self.text.find('\n', nl + 1)
+		
+		ln = bisect.bisect_right(self.starts, offset) - 1
+		start = self.starts[ln]
+		end = self.text.find('\n', start)
+		line = self.text[start:end if end >= 0 else len(self.text)]
+		return ln, offset - start, line
+
+class Pos(object):
+	'''Location of a token or syntax tree node: start and end offsets into
+	a Source. Line and column numbers are computed only when needed.'''
+	
+	__slots__ = 'source', 'start', 'end'
+	
+	def __init__(self, source, start, end):
+		self.source = source
+		self.start = start
+		self.end = end
+	
+	def __repr__(self):
+		return '<Pos(%r, %s, %s)>' % (self.source.fn, self.start, self.end)
+	
+	@property
+	def fn(self):
+		return self.source.fn
+	
+	def location(self):
+		'''Returns the 0-based line and column and the line (see Source)'''
+		return self.source.location(self.start)
+
 def error(fn, msg, pos):
 	'''Helper function to print useful error messages.
 	
@@ -37,14 +106,15 @@ def error(fn, msg, pos):
 	if pos is None:
 		return '%s: %s\n' % (fn, msg)
 	
-	col = len(pos[2][:pos[0][1]].replace('\t', ' ' * 4)) + 1
-	desc = '%s [%s.%s]: %s' % (fn, pos[0][0] + 1, col, msg)
-	if not pos[2]:
+	ln, col, line = pos.location()
+	vcol = len(line[:col].replace('\t', ' ' * 4)) + 1
+	desc = '%s [%s.%s]: %s' % (fn, ln + 1, vcol, msg)
+	if not line:
 		return desc + '\n'
 	
-	line = pos[2].replace('\t', ' ' * 4).rstrip()
-	spaces = pos[0][1] + 3 * min(pos[0][1], pos[2].count('\t'))
-	return '\n'.join((desc, line, ' ' * spaces + '^')) + '\n'
+	text = line.replace('\t', ' ' * 4).rstrip()
+	spaces = col + 3 * min(col, line.count('\t'))
+	return '\n'.join((desc, text, ' ' * spaces + '^')) + '\n'
 
 class Error(Exception):
 	'''Error class used for throwing user errors from the compiler'''
@@ -54,8 +124,11 @@ class Error(Exception):
 		self.node = node
 		self.msg = msg
 	
+	def __reduce__(self):
+		return self.__class__, (self.node, self.msg)
+	
 	def show(self):
-		fn = os.path.basename(self.node.pos[3])
+		fn = os.path.basename(self.node.pos.fn)
 		return error(fn, self.msg, getattr(self.node, 'pos', None))
 
 class ParseError(Exception):
@@ -66,7 +139,10 @@ class ParseError(Exception):
 		self.t = t
 		self.pos = pos
 	
+	def __reduce__(self):
+		return self.__class__, (self.fn, self.t, self.pos)
+	
 	def show(self):
-		fn = os.path.basename(self.pos[3])
+		fn = os.path.basename(self.pos.fn)
 		msg = 'unexpected token %s (%r)' % (self.t.name, self.t.value)
 		return error(fn, msg, self.pos)
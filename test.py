@@ -1,10 +1,12 @@
 from __future__ import print_function
-import sys, os, unittest, subprocess, json
-from runac import util
+import sys, os, re, unittest, subprocess, json, time, multiprocessing
+from runac import blocks, cache, dataflow, incremental, parser, stats, types, util
+import rply
 import runac
 
 DIR = os.path.dirname(__file__)
 TEST_DIR = os.path.join(DIR, 'tests')
+MODULE_DIR = os.path.join(TEST_DIR, 'modules')
 TESTS = [i[:-4] for i in os.listdir(TEST_DIR) if i.endswith('.rns')]
 
 def getspec(src):
@@ -17,13 +19,52 @@ def getspec(src):
 
 def compile(src, bin):
 	try:
-		runac.compile(runac.ir(src), bin)
+		runac.build(src, bin)
 		return None
 	except util.Error as e:
 		return e.show()
 	except util.ParseError as e:
 		return e.show()
 
+def stamp(src):
+	'''Returns a hash of everything a test binary depends on: the test
+	source, the compiler, the core library (including the run-time) and
+	the modules tests can import'''
+	parts = [cache.version()]
+	for fn in sorted(os.listdir(util.CORE_DIR)):
+		with open(os.path.join(util.CORE_DIR, fn), 'rb') as f:
+			parts += [fn, f.read()]
+	for fn in sorted(os.listdir(MODULE_DIR)):
+		with open(os.path.join(MODULE_DIR, fn), 'rb') as f:
+			parts += [fn, f.read()]
+	with open(src, 'rb') as f:
+		parts.append(f.read())
+	return cache.digest(*parts)
+
+def build(src, bin):
+	'''Like compile(), but skip compilation if the binary (or the compiler
+	error) is still there from a previous build with the same stamp.
+	Returns the error, if any, and whether the compiler was skipped.'''
+	
+	key, hash = cache.digest(os.path.abspath(bin)), stamp(src)
+	data = cache.read('tests', key)
+	if data is not None:
+		prev = json.loads(data.decode('utf-8'))
+		if prev['hash'] == hash and (prev['error'] or os.path.exists(bin)):
+			return prev['error'], True
+	
+	if os.path.exists(bin):
+		os.unlink(bin)
+	
+	out = compile(src, bin)
+	if out is not None or os.path.exists(bin):
+		data = json.dumps({'hash': hash, 'error': out})
+		cache.write('tests', key, data.encode('utf-8'))
+	
+	return out, False
+
+TIMES = {}
+
 def run(self, key):
 	
 	fullname = os.path.join(TEST_DIR, key + '.rns')
@@ -32,21 +73,26 @@ def run(self, key):
 	
 	spec = getspec(fullname)
 	type = spec.get('type', 'test')
+	times = TIMES[key] = [None, None, False]
+	start = time.time()
 	if type == 'show':
 		out = '\n'.join(runac.show(fullname, None)) + '\n'
 	else:
-		out = compile(fullname, bin)
+		out, times[2] = build(fullname, bin)
+	times[0] = time.time() - start
 	
 	if out and sys.version_info[0] > 2:
 		out = out.encode('utf-8')
 	
 	if not out:
+		start = time.time()
 		cmd = [bin] + spec.get('args', [])
 		opts = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
 		proc = subprocess.Popen(cmd, **opts)
 		res = [proc.wait(), proc.stdout.read(), proc.stderr.read()]
 		proc.stdout.close()
 		proc.stderr.close()
+		times[1] = time.time() - start
 	elif type == 'show':
 		res = [0, out, bytes()]
 	else:
@@ -82,8 +128,273 @@ for key in TESTS:
 
 LangTests = type('LangTests', (unittest.TestCase,), attrs)
 
+# Sources for the lexer tests, next to the test and core library files
+LEX_CASES = [
+	'', '\n', 'x', '\tx\n', 'a\n\t\tb\n\tc\nd', 'a\n\t \tb\n', 'a\n\t\n\tb\n',
+	'def f():\n\t\t\tx\ny\n', '# c\n\t# x\nfoo\n\n\n\t\tbar\n',
+	'a = 3-1+2\n', '1.5 .5 5. 3?[4\n', 'Truex Nonex False_ None\n',
+	'a != b -> c += d <= e >= f == g\n', '$&|^%(){}[]:,.?',
+	'"a" \'b\' "c\n', "'abc\n'", 'a ! b', 'x\r\n',
+]
+
+def tokens(lex, src):
+	'''Returns a list of token tuples (including positions), or the position
+	of the lexing error'''
+	try:
+		return [(t.name, t.value, t.source_pos.idx, t.source_pos.lineno,
+		         t.source_pos.colno) for t in lex(src)]
+	except rply.LexingError as e:
+		return e.source_pos.idx, e.source_pos.lineno
+
+class LexerTests(unittest.TestCase):
+	'''Check that the scanner in parser.lex() returns the same tokens as the
+	rply-based parser.reference()'''
+	
+	def compare(self, src):
+		expected = tokens(parser.reference, src)
+		self.assertEqual(expected, tokens(parser.lex, src))
+	
+	def test_sources(self):
+		for dir in (TEST_DIR, util.CORE_DIR):
+			for fn in sorted(os.listdir(dir)):
+				if fn.endswith('.rns'):
+					with open(os.path.join(dir, fn)) as f:
+						self.compare(f.read())
+	
+	def test_cases(self):
+		for src in LEX_CASES:
+			self.compare(src)
+
+def graph(edges):
+	'''Returns a FlowGraph with the given (source, destination) edges'''
+	flow = blocks.FlowGraph()
+	for i in range(max(max(e) for e in edges)):
+		flow.block()
+	for src, dst in edges:
+		flow.edge(src, dst)
+	flow.link()
+	return flow
+
+class DataflowTests(unittest.TestCase):
+	'''Check the dataflow framework on a small CFG: a loop (1-3) with an
+	early exit (4), a normal exit (5) and an unreachable block (6)'''
+	
+	EDGES = (0, 1), (1, 2), (2, 3), (3, 1), (2, 4), (1, 5), (6, 5)
+	
+	def test_order(self):
+		flow = graph(self.EDGES)
+		self.assertEqual(dataflow.order(flow), [0, 1, 5, 2, 4, 3, 6])
+	
+	def test_backward(self):
+		# which of the exits (4 and 5) can be reached from each block
+		flow = graph(self.EDGES)
+		gen = {4: 1, 5: 2}
+		before, after = dataflow.solve('exits', flow, gen, {}, forward=False)
+		self.assertEqual(before, {0: 3, 1: 3, 2: 3, 3: 3, 4: 1, 5: 2, 6: 2})
+		self.assertEqual(after[2], 3)
+		self.assertEqual(after[4], 0)
+	
+	def test_dominators(self):
+		flow = graph(self.EDGES)
+		gen = {id: 1 << id for id in flow.blocks}
+		universe = (1 << len(flow.blocks)) - 1
+		before, after = dataflow.solve('dom', flow, gen, {}, universe=universe)
+		doms = {id: set(dataflow.members(bits)) for (id, bits) in after.items()}
+		self.assertEqual(doms[3], {0, 1, 2, 3})
+		self.assertEqual(doms[4], {0, 1, 2, 4})
+		self.assertEqual(doms[5], {5})
+		self.assertEqual(doms[6], {6})
+
+class TypeTests(unittest.TestCase):
+	'''Check that types are interned, so that they compare by identity'''
+	
+	def test_interned(self):
+		map = types.TypeMap()
+		self.assertIs(map.get('void'), types.void())
+		self.assertIs(map.get('&void'), types.ref(types.void()))
+		self.assertIsNot(map.get('&void'), map.get('$void'))
+		fun = types.function(types.void(), (map.get('&void'),))
+		self.assertIs(fun, types.function(map.get('void'), (map.get('&void'),)))
+	
+	def test_tuples(self):
+		map = types.TypeMap()
+		params = map.get('anyint'), map.get('&void')
+		self.assertIs(map.build_tuple(params), map.build_tuple(list(params)))
+	
+	def test_compat(self):
+		types.reset()
+		any, void = types.anyint(), types.void()
+		self.assertFalse(types.compat(any, void))
+		self.assertIn((any, void, False), types.COMPAT)
+		self.assertTrue(types.compat([any, void], (any, void)))
+		types.reset()
+		self.assertEqual(types.COMPAT, {})
+	
+	def test_reset(self):
+		runac.ir(os.path.join(TEST_DIR, 'class.rns'))
+		self.assertTrue(types.ref.interned)
+		types.reset()
+		self.assertFalse(types.ref.interned)
+		self.assertFalse(types.owner.interned)
+		self.assertFalse(types.function.interned)
+		self.assertFalse(types.DISPATCH)
+
+class ParallelTests(unittest.TestCase):
+	'''Check that running the passes in worker processes (see the
+	incremental module) produces the same IR as a serial run'''
+	
+	def setUp(self):
+		self.saved = runac.JOBS, incremental.BATCH, cache.ENABLED
+		cache.ENABLED = False
+	
+	def tearDown(self):
+		runac.JOBS, incremental.BATCH, cache.ENABLED = self.saved
+	
+	def test_same(self):
+		fn = os.path.join(TEST_DIR, 'class.rns')
+		runac.JOBS = 1
+		serial = runac.ir(fn)
+		runac.JOBS, incremental.BATCH = 2, 1
+		self.assertEqual(runac.ir(fn), serial)
+	
+	def test_error(self):
+		fn = os.path.join(TEST_DIR, 'num-params.rns')
+		runac.JOBS, incremental.BATCH = 2, 1
+		with self.assertRaises(util.Error) as ctx:
+			runac.ir(fn)
+		self.assertIn('cannot be passed as (i32)', ctx.exception.msg)
+	
+	def test_units(self):
+		
+		fn = os.path.join(TEST_DIR, 'class.rns')
+		defined = re.compile(r'^define \S+ @([\w.$]+)\(', re.M)
+		serial = defined.findall(runac.ir(fn))
+		serial = [n for n in serial if not n.startswith('Runa.rt.')]
+		mod = runac.prepare(fn)
+		runac.merge(mod)
+		units = incremental.split(mod, 3)
+		self.assertEqual(len(units), 3)
+		
+		names = [defined.findall(ir) for ir in units]
+		self.assertEqual(sorted(sum(names, [])), sorted(serial))
+		for ir, local in zip(units, names):
+			declared = re.findall(r'^declare \S+ @([\w.$]+)\(', ir, re.M)
+			for name in set(re.findall(r'@([\w.$]+)', ir)) - set(local):
+				if name in serial:
+					self.assertIn(name, declared)
+
+class ReachTests(unittest.TestCase):
+	'''Check that unreachable code from the core library is left out
+	(see the reach module)'''
+	
+	def code(self, name):
+		mod = runac.prepare(os.path.join(TEST_DIR, name + '.rns'))
+		runac.merge(mod)
+		return [k for (k, fun) in mod.code]
+	
+	def test_hello(self):
+		names = self.code('hello')
+		self.assertIn('print', names)
+		self.assertIn(('str', '__init__'), names)
+		self.assertIn(('int', '__str__'), names)
+		self.assertNotIn(('str', '__eq__'), names)
+		self.assertNotIn(('float', '__str__'), names)
+		self.assertNotIn(('Exception', '__init__'), names)
+	
+	def test_operators(self):
+		names = self.code('str-ops')
+		self.assertIn(('str', '__eq__'), names)
+		self.assertIn(('str', '__add__'), names)
+	
+	def test_imports(self):
+		core = len(runac.core().code)
+		self.assertEqual(len(self.code('import')), core + 1)
+	
+	def test_defined(self):
+		ir = runac.ir(os.path.join(TEST_DIR, 'str-ops.rns'))
+		defined = re.findall(r'^(?:define|declare) [^@]*@([\w.$]+)\(', ir, re.M)
+		defined += re.findall(r'^@([\w.$]+) =', ir, re.M)
+		for name in set(re.findall(r'@([\w.$]+)', ir)):
+			self.assertIn(name, defined)
+
+class StatsTests(unittest.TestCase):
+	'''Check that phases are recorded when compiling with statistics
+	enabled (see the stats module)'''
+	
+	def setUp(self):
+		self.saved = stats.TIME, stats.MEMORY, stats.START, stats.PEAK
+		self.saved += cache.ENABLED,
+		self.tracing = stats.tracemalloc and stats.tracemalloc.is_tracing()
+		cache.ENABLED = False
+		stats.RECORDS[:] = []
+	
+	def tearDown(self):
+		stats.TIME, stats.MEMORY, stats.START, stats.PEAK = self.saved[:4]
+		cache.ENABLED = self.saved[4]
+		stats.RECORDS[:] = []
+		stats.COUNTS.clear()
+		if stats.tracemalloc and not self.tracing:
+			stats.tracemalloc.stop()
+	
+	def test_memory(self):
+		stats.enable(memory=True)
+		runac.ir(os.path.join(TEST_DIR, 'hello.rns'))
+		phases = set(rec['phase'] for rec in stats.RECORDS)
+		self.assertIn('parse', phases)
+		self.assertIn('codegen', phases)
+		if hasattr(stats.tracemalloc, 'reset_peak'):
+			self.assertTrue(all('memory' in rec for rec in stats.RECORDS))
+			self.assertTrue(stats.PEAK > 0)
+		else:
+			self.assertFalse(stats.MEMORY)
+
+# Unit tests for the compiler modules, next to the language tests
+UNITS = LexerTests, DataflowTests, TypeTests, ParallelTests, ReachTests, StatsTests
+
 def suite():
-    return unittest.makeSuite(LangTests, 'test')
+    return unittest.TestSuite([
+        unittest.makeSuite(LangTests, 'test'),
+    ] + [unittest.makeSuite(cls, 'test') for cls in UNITS])
+
+def check(key):
+	try:
+		res, msg = ('pass' if run(None, key) else 'FAIL'), ''
+	except Exception as e:
+		res, msg = 'ERROR', '  (%s)' % e
+	return key, res, msg, TIMES.get(key)
+
+def parallel(jobs=None):
+	'''Run all tests on a pool of `jobs` worker processes (defaults to
+	the number of CPUs) and report timings for each test. The core library
+	is loaded up front, so each worker starts from the same snapshot
+	instead of parsing it again for every test. The unit tests (see
+	`UNITS`) run afterwards, in this process.'''
+	
+	runac.core()
+	pool = multiprocessing.Pool(jobs, initializer=runac.core)
+	start, failed = time.time(), 0
+	for key, res, msg, times in pool.imap_unordered(check, sorted(TESTS)):
+		
+		failed += res != 'pass'
+		ctime = rtime = '-'
+		if times and times[2]:
+			ctime = 'cached'
+		elif times and times[0] is not None:
+			ctime = '%.1f ms' % (times[0] * 1000)
+		if times and times[1] is not None:
+			rtime = '%.1f ms' % (times[1] * 1000)
+		
+		bits = key, res, ctime, rtime, msg
+		print('%-24s %-5s compile %10s  run %10s%s' % bits)
+	
+	pool.close()
+	pool.join()
+	bits = len(TESTS), failed, time.time() - start
+	print('\nRan %i tests, %i failed (%.2fs)' % bits)
+	
+	units = unittest.TestSuite(unittest.makeSuite(cls, 'test') for cls in UNITS)
+	res = unittest.TextTestRunner(stream=sys.stdout).run(units)
+	return not failed and res.wasSuccessful()
 
 IGNORE = [
 	'Memcheck', 'WARNING:', 'HEAP SUMMARY:', 'LEAK SUMMARY:',
@@ -142,6 +453,9 @@ def leaks():
 if __name__ == '__main__':
 	if len(sys.argv) > 1 and sys.argv[1] == '--leaks':
 		leaks()
+	elif len(sys.argv) > 1 and sys.argv[1].startswith('-j'):
+		jobs = sys.argv[1][2:] or (sys.argv[2] if len(sys.argv) > 2 else 0)
+		sys.exit(0 if parallel(int(jobs) or None) else 1)
 	elif len(sys.argv) > 1:
 		print(run(None, sys.argv[1]))
 	else: